@@ -10,9 +10,92 @@ class Settings:
     # Database
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     MONGO_DB_NAME: str = os.getenv("MONGO_DB_NAME", "triangle_db")
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+    # Create missing indexes in a background thread at startup (otherwise run `python migrate.py`)
+    CREATE_INDEXES_ON_STARTUP: bool = os.getenv("CREATE_INDEXES_ON_STARTUP", "true").lower() == "true"
     
     # YouTube API Keys (Comma separated in .env)
     # Default keys are placeholders. You must provide valid keys in .env or here.
     YOUTUBE_API_KEYS: list = os.getenv("YOUTUBE_API_KEYS", "").split(",")
+    # Daily quota budget per key (YouTube grants 10,000 units; keep a safety margin)
+    YOUTUBE_DAILY_QUOTA: int = int(os.getenv("YOUTUBE_DAILY_QUOTA", "9500"))
+    KEY_POOL_FLUSH_SECONDS: float = float(os.getenv("KEY_POOL_FLUSH_SECONDS", "30"))
+
+    # Auth: verified Firebase ID tokens kept in memory until they expire
+    TOKEN_CACHE_SIZE: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+    # Fetch Pipeline
+    FETCH_CONCURRENCY: int = int(os.getenv("FETCH_CONCURRENCY", "8"))
+    FETCH_PER_KEY_CONCURRENCY: int = int(os.getenv("FETCH_PER_KEY_CONCURRENCY", "4"))
+    FETCH_REQUESTS_PER_SECOND: float = float(os.getenv("FETCH_REQUESTS_PER_SECOND", "10"))
+    FETCH_WRITE_QUEUE_SIZE: int = int(os.getenv("FETCH_WRITE_QUEUE_SIZE", "32"))
+    # Workers of the parse/score and DB write stages of a sweep (FETCH_CONCURRENCY is the fetch stage)
+    FETCH_PARSE_WORKERS: int = int(os.getenv("FETCH_PARSE_WORKERS", "2"))
+    FETCH_WRITE_WORKERS: int = int(os.getenv("FETCH_WRITE_WORKERS", "1"))
+    # How often a running sweep logs the queue depth and throughput of each stage
+    FETCH_STAGE_REPORT_SECONDS: float = float(os.getenv("FETCH_STAGE_REPORT_SECONDS", "30"))
+    BULK_WRITE_BATCH_SIZE: int = int(os.getenv("BULK_WRITE_BATCH_SIZE", "500"))
+    BULK_WRITE_MAX_INTERVAL_SECONDS: float = float(os.getenv("BULK_WRITE_MAX_INTERVAL_SECONDS", "5"))
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "15"))
+    # Hours after which a fetched combination counts as fully stale again
+    FETCH_PLANNER_REFRESH_HOURS: float = float(os.getenv("FETCH_PLANNER_REFRESH_HOURS", "24"))
+    # Incremental searches re-cover this much time before each query's watermark
+    FETCH_WATERMARK_OVERLAP_MINUTES: int = int(os.getenv("FETCH_WATERMARK_OVERLAP_MINUTES", "60"))
+    # Share of the remaining daily quota kept for stats refreshes; sweeps split the rest over the day
+    STATS_REFRESH_QUOTA_SHARE: float = float(os.getenv("STATS_REFRESH_QUOTA_SHARE", "0.2"))
+
+    # Jobs
+    # Run the scheduler inside the web process too. Off by default: `python -m app.worker` runs it.
+    RUN_SCHEDULER_IN_WEB: bool = os.getenv("RUN_SCHEDULER_IN_WEB", "false").lower() == "true"
+    FETCH_INTERVAL_MINUTES: int = int(os.getenv("FETCH_INTERVAL_MINUTES", "60"))
+    # A job lock whose holder stops renewing it expires after this long
+    JOB_LOCK_TTL_SECONDS: int = int(os.getenv("JOB_LOCK_TTL_SECONDS", "300"))
+
+    # User Activity: events are merged per (user, video) and flushed in one bulk_write this often,
+    # or sooner once this many pairs are pending
+    ACTIVITY_FLUSH_SECONDS: float = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "5"))
+    ACTIVITY_BUFFER_MAX_KEYS: int = int(os.getenv("ACTIVITY_BUFFER_MAX_KEYS", "5000"))
+    ACTIVITY_BATCH_MAX_EVENTS: int = int(os.getenv("ACTIVITY_BATCH_MAX_EVENTS", "500"))
+
+    # Personalized Feed
+    # Candidates per tier reranked for each user, and the boosts (extra multiples of weighted views)
+    # for a followed channel and for the user's favourite niche
+    PERSONAL_CANDIDATES: int = int(os.getenv("PERSONAL_CANDIDATES", "500"))
+    PERSONAL_FOLLOW_BOOST: float = float(os.getenv("PERSONAL_FOLLOW_BOOST", "2.0"))
+    PERSONAL_NICHE_BOOST: float = float(os.getenv("PERSONAL_NICHE_BOOST", "1.0"))
+    # Recent activity documents read to build a user's affinity, and how long it is cached
+    PERSONAL_ACTIVITY_DEPTH: int = int(os.getenv("PERSONAL_ACTIVITY_DEPTH", "500"))
+    PERSONAL_CACHE_SIZE: int = int(os.getenv("PERSONAL_CACHE_SIZE", "10000"))
+    PERSONAL_CACHE_TTL_SECONDS: float = float(os.getenv("PERSONAL_CACHE_TTL_SECONDS", "300"))
+
+    # Candidate Store: web processes keep every ranked video in memory for feeds and /api/video,
+    # checking for a rebuilt viral index this often
+    CANDIDATE_STORE_ENABLED: bool = os.getenv("CANDIDATE_STORE_ENABLED", "true").lower() == "true"
+    CANDIDATE_STORE_REFRESH_SECONDS: float = float(os.getenv("CANDIDATE_STORE_REFRESH_SECONDS", "30"))
+
+    # Stats Refresh
+    # Counts and scores of ranked and recent videos are refreshed this often, between discovery sweeps
+    STATS_REFRESH_MINUTES: int = int(os.getenv("STATS_REFRESH_MINUTES", "15"))
+    STATS_REFRESH_RECENT_HOURS: int = int(os.getenv("STATS_REFRESH_RECENT_HOURS", "48"))
+    STATS_REFRESH_MAX_RECENT: int = int(os.getenv("STATS_REFRESH_MAX_RECENT", "2000"))
+
+    # Viral Index
+    VIRAL_GLOBAL_DEPTH: int = int(os.getenv("VIRAL_GLOBAL_DEPTH", "100"))
+    VIRAL_TIER_DEPTH: int = int(os.getenv("VIRAL_TIER_DEPTH", "50"))
+    # Rescore the whole videos collection (vectorized) before every index rebuild
+    RESCORE_ON_REBUILD: bool = os.getenv("RESCORE_ON_REBUILD", "true").lower() == "true"
+
+    # Feed Cache
+    # "sqlite" shares one cache file between all worker processes; "memory" is per process
+    FEED_CACHE_BACKEND: str = os.getenv("FEED_CACHE_BACKEND", "sqlite")
+    FEED_CACHE_PATH: str = os.getenv("FEED_CACHE_PATH", "")
+    FEED_CACHE_SIZE: int = int(os.getenv("FEED_CACHE_SIZE", "2048"))
+    FEED_CACHE_TTL_SECONDS: float = float(os.getenv("FEED_CACHE_TTL_SECONDS", "60"))
+    # How long a SQLite cache read or write waits for another worker's lock before it counts as a miss
+    FEED_CACHE_TIMEOUT_SECONDS: float = float(os.getenv("FEED_CACHE_TIMEOUT_SECONDS", "0.1"))
 
 settings = Settings()
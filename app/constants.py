@@ -40,3 +40,16 @@ LANGUAGES = [
     "Punjabi",
     "English"
 ]
+
+# Regional language of each state; videos in their state's language get a ranking boost
+STATE_LANGUAGE_MAP = {
+    "Maharashtra": "Marathi",
+    "Tamil Nadu": "Tamil",
+    "Andhra Pradesh": "Telugu",
+    "Telangana": "Telugu",
+    "Karnataka": "Kannada",
+    "Kerala": "Malayalam",
+    "West Bengal": "Bengali",
+    "Gujarat": "Gujarati",
+    "Punjab": "Punjabi"
+}
@@ -1,52 +1,217 @@
-from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+import threading
+import logging
+from pymongo import MongoClient, AsyncMongoClient, IndexModel, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
 from .config import settings
 
-client = MongoClient(settings.MONGO_URI)
-db = client[settings.MONGO_DB_NAME]
+logger = logging.getLogger("uvicorn")
+
+# Shared pool sizing and timeouts, so a slow or unreachable server fails requests fast
+# instead of piling them up.
+CLIENT_OPTIONS = {
+    "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+    "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+    "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+    "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+}
+
+# Clients are created on first use, so importing this module (and the app) opens no
+# connections and does no DNS lookups.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(kind):
+    client = _clients.get(kind)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(kind)
+            if client is None:
+                client_class = AsyncMongoClient if kind == "async" else MongoClient
+                client = _clients[kind] = client_class(settings.MONGO_URI, **CLIENT_OPTIONS)
+    return client
+
+
+def get_db():
+    """Synchronous database: background jobs, scripts and migrations."""
+    return _get_client("sync")[settings.MONGO_DB_NAME]
+
+
+def get_async_db():
+    """Async database: request handlers, so a request waiting on MongoDB does not hold a threadpool thread."""
+    return _get_client("async")[settings.MONGO_DB_NAME]
+
+
+class _LazyCollection:
+    """Stands in for a collection and resolves it on first attribute access."""
+    def __init__(self, name, get_database):
+        self._name = name
+        self._get_database = get_database
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = self._get_database()[self._name]
+        return getattr(self._collection, attr)
+
 
 # --- Core Data Collections ---
-videos_collection = db["videos"]
-channels_collection = db["channels"]
-viral_index_collection = db["viral_index"]
-api_key_usage_collection = db["api_key_usage"]
+videos_collection = _LazyCollection("videos", get_db)
+channels_collection = _LazyCollection("channels", get_db)
+viral_index_collection = _LazyCollection("viral_index", get_db)
+api_key_usage_collection = _LazyCollection("api_key_usage", get_db)
+fetch_stats_collection = _LazyCollection("fetch_stats", get_db)
+job_locks_collection = _LazyCollection("job_locks", get_db)
+job_runs_collection = _LazyCollection("job_runs", get_db)
 
 # --- User Data Collections ---
-users_collection = db["users"]
-user_activity_collection = db["user_activity"]
-user_follows_collection = db["user_follows"]
-
-
-def create_indexes():
-    # Videos indexes
-    videos_collection.create_index("video_id", unique=True)
-    videos_collection.create_index([("state", 1), ("language", 1)])
-    videos_collection.create_index("viral_score")
-    videos_collection.create_index([("state", 1)])
-    videos_collection.create_index([("language", 1)])
-    videos_collection.create_index([("published_at", DESCENDING)])
-    
-    # Channels indexes
-    channels_collection.create_index("channel_id", unique=True)
-    
-    # Viral Index indexes
-    viral_index_collection.create_index([("viral_type", 1), ("rank", 1)])
-    viral_index_collection.create_index([("viral_type", 1), ("state", 1), ("language", 1)])
-    
-    # API Key Usage indexes
-    api_key_usage_collection.create_index("api_key", unique=True)
+users_collection = _LazyCollection("users", get_db)
+user_activity_collection = _LazyCollection("user_activity", get_db)
+user_follows_collection = _LazyCollection("user_follows", get_db)
 
+# --- Async handles for request handlers ---
+async_videos_collection = _LazyCollection("videos", get_async_db)
+async_viral_index_collection = _LazyCollection("viral_index", get_async_db)
+async_users_collection = _LazyCollection("users", get_async_db)
+async_user_activity_collection = _LazyCollection("user_activity", get_async_db)
+async_user_follows_collection = _LazyCollection("user_follows", get_async_db)
+
+
+# Indexes for a viral_index collection. Also applied to staging collections before they are swapped in.
+VIRAL_INDEX_INDEXES = [
+    IndexModel([("viral_type", 1), ("rank", 1)]),
+    # Feed reads: one ranking (all, shorts or non-shorts) of one tier, in rank order
+    IndexModel([("viral_type", 1), ("state", 1), ("language", 1), ("shorts", 1), ("rank", 1)]),
+]
+
+INDEXES = {
+    # One index per query shape: equality fields first, then the sort key, so every feed query
+    # walks the index in order and stops at `limit` (see `python audit_indexes.py`).
+    "videos": [
+        IndexModel("video_id", unique=True),
+        # GET /api/feed: {state?, language?} sorted by viral_score descending
+        IndexModel([("state", 1), ("language", 1), ("viral_score", DESCENDING)]),
+        IndexModel([("state", 1), ("viral_score", DESCENDING)]),
+        IndexModel([("language", 1), ("viral_score", DESCENDING)]),
+        IndexModel("viral_score"),
+        # published_at feed fallback (keyset pagination), with and without is_short;
+        # also serves published_at range scans
+        IndexModel([("published_at", DESCENDING), ("video_id", DESCENDING)]),
+        IndexModel([("is_short", ASCENDING), ("published_at", DESCENDING), ("video_id", DESCENDING)]),
+    ],
+    "channels": [
+        IndexModel("channel_id", unique=True),
+    ],
+    "viral_index": VIRAL_INDEX_INDEXES,
+    "api_key_usage": [
+        IndexModel("api_key", unique=True),
+    ],
+    "fetch_stats": [
+        IndexModel([("niche", 1), ("state", 1), ("language", 1)], unique=True),
+    ],
+    "job_runs": [
+        IndexModel([("job", 1), ("started_at", DESCENDING)]),
+    ],
     # User Data Indexes
-    users_collection.create_index("uid", unique=True)
-    users_collection.create_index("username", unique=True)
-    
+    "users": [
+        IndexModel("uid", unique=True),
+        IndexModel("username", unique=True),
+        # Case-insensitive lookups and prefix search; users without a username are left out
+        IndexModel("username_lower", unique=True, partialFilterExpression={"username_lower": {"$exists": True}}),
+    ],
     # User Activity Indexes - Optimized for Feed Analysis
-    user_activity_collection.create_index([("uid", 1), ("video_id", 1)], unique=True)
-    user_activity_collection.create_index([("uid", 1), ("liked", 1)])
-    user_activity_collection.create_index([("uid", 1), ("replay_count", -1)])
-    user_activity_collection.create_index([("uid", 1), ("paused_at", 1)])
+    "user_activity": [
+        IndexModel([("uid", 1), ("video_id", 1)], unique=True),
+        IndexModel([("uid", 1), ("liked", 1)]),
+        IndexModel([("uid", 1), ("replay_count", -1)]),
+        IndexModel([("uid", 1), ("paused_at", 1)]),
+        # Most recent activity of a user, for personalized ranking
+        IndexModel([("uid", 1), ("last_event_at", DESCENDING)]),
+    ],
+    "user_follows": [
+        IndexModel([("uid", 1), ("channel_id", 1)], unique=True),
+    ],
+}
+
+
+def create_viral_index_indexes(collection):
+    collection.create_indexes(VIRAL_INDEX_INDEXES)
+
+
+def normalize_username(username: str) -> str:
+    """The case-insensitive form of a username stored in `username_lower`."""
+    return username.strip().lower()
+
+
+def backfill_username_lower(batch_size=1000):
+    """
+    Sets `username_lower` on users registered before it existed; username lookup, search and
+    the uniqueness check only match on it. When two usernames differ only in case, the first
+    keeps the normalized name and the others are returned for a manual rename, so the unique
+    index can still be built. Returns (users updated, [(uid, username), ...] conflicts).
+    """
+    missing = {"username": {"$type": "string"}, "username_lower": {"$exists": False}}
+    if users_collection.find_one(missing, {"_id": 1}) is None:
+        return 0, []
+    taken = {u["username_lower"] for u in users_collection.find({"username_lower": {"$exists": True}}, {"username_lower": 1})}
+    batch, conflicts, updated = [], [], 0
+
+    def write(batch):
+        ops = [UpdateOne({"_id": user["_id"]}, {"$set": {"username_lower": lower}}) for user, lower in batch]
+        try:
+            return users_collection.bulk_write(ops, ordered=False).modified_count
+        except BulkWriteError as e:
+            # Someone registered the same name meanwhile; the unique index kept theirs
+            conflicts.extend((batch[error["index"]][0].get("uid"), batch[error["index"]][0]["username"]) for error in e.details.get("writeErrors", []))
+            return e.details.get("nModified", 0)
+
+    for user in users_collection.find(missing, {"uid": 1, "username": 1}).sort("_id", 1):
+        username_lower = normalize_username(user["username"])
+        if username_lower in taken:
+            conflicts.append((user.get("uid"), user["username"]))
+            continue
+        taken.add(username_lower)
+        batch.append((user, username_lower))
+        if len(batch) == batch_size:
+            updated += write(batch)
+            batch = []
+    if batch:
+        updated += write(batch)
+    return updated, conflicts
+
 
-    user_follows_collection.create_index([("uid", 1), ("channel_id", 1)], unique=True)
+def ensure_indexes():
+    """
+    Creates any index from INDEXES that does not exist yet, with one createIndexes command per
+    collection. Indexes that already exist with the same key pattern are skipped.
+    Returns the names of the indexes that were created.
+    """
+    db = get_db()
+    created = []
+    for name, models in INDEXES.items():
+        collection = db[name]
+        existing = {tuple(info["key"]) for info in collection.index_information().values()}
+        missing = [model for model in models if tuple(model.document["key"].items()) not in existing]
+        if missing:
+            created.extend(collection.create_indexes(missing))
+    return created
 
 
-# Initialize indexes on startup
-create_indexes()
+def redundant_indexes():
+    """
+    Existing indexes that are not in INDEXES and whose keys are a prefix of an index that is,
+    e.g. the old single-field state/language indexes. Any query they served is served by the
+    longer index, so they only cost writes. Returns {collection name: [index name, ...]}.
+    """
+    db = get_db()
+    redundant = {}
+    for name, models in INDEXES.items():
+        defined = [tuple(model.document["key"].items()) for model in models]
+        for index_name, info in db[name].index_information().items():
+            key = tuple(info["key"])
+            if index_name == "_id_" or key in defined:
+                continue
+            if any(len(key) < len(d) and d[:len(key)] == key for d in defined):
+                redundant.setdefault(name, []).append(index_name)
+    return redundant
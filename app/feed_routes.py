@@ -1,21 +1,45 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends
+from fastapi.concurrency import run_in_threadpool
 import pymongo
 import logging
+import base64
+import datetime
+import json
 from typing import Optional, List
 import traceback
 from pydantic import BaseModel
 
-from .database import videos_collection
+from .database import async_videos_collection, async_viral_index_collection
+from .services.feed_cache import feed_cache
+from .services.personalization import affinity_cache, rerank
+from .services.candidate_store import candidate_store
+from .responses import RawJSONResponse, dumps, pack, unpack
+from .user_routes import get_bearer_token
+from .firebase_config import verify_token
+from .config import settings
 
 logger = logging.getLogger("uvicorn")
 router = APIRouter()
 
+# Only the fields _format_video_for_feed reads
+FEED_PROJECTION = {
+    "_id": 0, "video_id": 1, "title": 1, "channel_title": 1, "channel_thumbnail": 1,
+    "like_count": 1, "comment_count": 1, "is_short": 1
+}
+
+# Tier name used in cursors and X-Feed-Tier once every viral_index tier is exhausted
+RECENT_TIER = "RECENT"
+# Tier name of pages reranked for the signed-in user
+PERSONAL_TIER = "PERSONALIZED"
+
 class FeedRequest(BaseModel):
     state: Optional[str] = None
     language: Optional[str] = None
     limit: int = 20
     skip: int = 0
     is_short: Optional[bool] = None
+    cursor: Optional[str] = None  # Opaque token from the X-Next-Cursor header of the previous page; replaces skip
+    personalized: bool = False  # Rerank for the signed-in user (needs an Authorization header)
 
 def _format_video_for_feed(video):
     """
@@ -40,52 +64,253 @@ def _format_video_for_feed(video):
         "is_short": video.get("is_short", False) # Added is_short flag
     }
 
+def _tier_chain(state, language):
+    """The viral_index tiers to try, most specific first, as (viral_type, state, language) keys."""
+    chain = []
+    if state and language:
+        chain.append(("STATE_LANGUAGE", state, language))
+    if language:
+        chain.append(("LANGUAGE", None, language))
+    if state:
+        chain.append(("STATE", state, None))
+    chain.append(("GLOBAL", None, None))
+    return chain
+
+def _encode_cursor(position):
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(token):
+    """Returns the position stored in a cursor, or None if the token is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        position = json.loads(raw)
+        return position if isinstance(position, dict) and "t" in position else None
+    except (ValueError, TypeError):
+        return None
+
+async def _read_tier(tier, is_short, skip, limit, after_rank=None):
+    """
+    Returns one page of (rank, video_id) from a precomputed viral_index tier, in rank order,
+    using the tier's ranking of all videos, shorts or non-shorts to match `is_short`. With `after_rank` the page starts right after that rank (keyset seek) instead of skipping.
+    Read from the candidate store once it is loaded.
+    """
+    if candidate_store.ready:
+        return [(rank, c.video_id) for rank, c in candidate_store.page(tier, is_short, skip, limit, after_rank)]
+    viral_type, state, language = tier
+    query = {"viral_type": viral_type, "state": state, "language": language, "shorts": is_short}
+    if after_rank is not None:
+        query["rank"] = {"$gt": after_rank}
+    cursor = async_viral_index_collection.find(query, {"_id": 0, "video_id": 1, "rank": 1}).sort("rank", pymongo.ASCENDING).skip(skip).limit(limit)
+    return [(entry["rank"], entry["video_id"]) async for entry in cursor]
+
+async def _read_unseen(tier, is_short, skip, limit, after_rank, seen):
+    """Like _read_tier, but leaves out videos in `seen` and reads on until the page is full or the tier ends."""
+    entries = []
+    while len(entries) < limit:
+        batch = await _read_tier(tier, is_short, skip, limit, after_rank)
+        if not batch:
+            break
+        entries += [entry for entry in batch if entry[1] not in seen]
+        skip, after_rank = 0, batch[-1][0]
+    return entries[:limit]
+
+async def _tier_video_ids(tier, is_short):
+    """Every video_id in a tier's ranking for `is_short`."""
+    if candidate_store.ready:
+        return candidate_store.video_ids(tier, is_short)
+    viral_type, state, language = tier
+    query = {"viral_type": viral_type, "state": state, "language": language, "shorts": is_short}
+    return {entry["video_id"] async for entry in async_viral_index_collection.find(query, {"_id": 0, "video_id": 1})}
+
+async def _read_recent(is_short, skip, limit, after=None, exclude=()):
+    """Newest videos first, seeking past `after` = {"p": published_at, "v": video_id} when given, without `exclude`."""
+    query = {}
+    if is_short is not None:
+        query["is_short"] = is_short
+    if exclude:
+        query["video_id"] = {"$nin": list(exclude)}
+    if after:
+        published_at = datetime.datetime.fromisoformat(after["p"])
+        query["$or"] = [
+            {"published_at": {"$lt": published_at}},
+            {"published_at": published_at, "video_id": {"$lt": after["v"]}},
+        ]
+    projection = dict(FEED_PROJECTION, published_at=1)
+    sort = [("published_at", pymongo.DESCENDING), ("video_id", pymongo.DESCENDING)]
+    return await async_videos_collection.find(query, projection).sort(sort).skip(skip).limit(limit).to_list()
+
+async def _load_videos(video_ids):
+    """
+    Fetches the feed payloads for `video_ids`, keeping the given order. Ranked videos come from
+    the candidate store; the rest are read in one $in query.
+    """
+    if not video_ids:
+        return []
+    docs = {}
+    for video_id in video_ids:
+        candidate = candidate_store.get(video_id)
+        if candidate is not None:
+            docs[video_id] = candidate.feed_doc()
+    missing = [video_id for video_id in video_ids if video_id not in docs]
+    if missing:
+        docs.update({v["video_id"]: v async for v in async_videos_collection.find({"video_id": {"$in": missing}}, FEED_PROJECTION)})
+    return [docs[video_id] for video_id in video_ids if video_id in docs]
+
+async def _build_feed_page(state, language, limit, skip, is_short, position, exclude=()):
+    """
+    Builds one feed page and renders it to bytes. Returns pack(JSON body, response headers).
+
+    The tiers overlap (a STATE_LANGUAGE video is usually in its LANGUAGE, STATE and GLOBAL tiers
+    too), so every video of a tier the client has scrolled past is skipped in the tiers after
+    it and in the newest-videos fallback, as are the videos in `exclude`.
+    """
+    chain = _tier_chain(state, language)
+    start, after_rank = 0, None
+    if position:
+        tier = tuple(position["t"]) if isinstance(position["t"], list) else position["t"]
+        if tier == RECENT_TIER:
+            start = len(chain)
+        elif tier in chain:
+            start = chain.index(tier)
+            after_rank = position.get("r")
+
+    seen = set(exclude)
+    for tier in chain[:start]:
+        seen |= await _tier_video_ids(tier, is_short)
+
+    videos = []
+    next_position = None
+    for tier in chain[start:]:
+        entries = await _read_unseen(tier, is_short, skip, limit, after_rank, seen)
+        after_rank = None  # Only the cursor's own tier resumes mid-way; later tiers start at the top
+        if entries:
+            videos = await _load_videos([video_id for _, video_id in entries])
+        if videos:
+            next_position = {"t": list(tier), "r": entries[-1][0]}
+            break
+        seen |= await _tier_video_ids(tier, is_short)
+
+    if not videos:
+        logger.info("No more ranked videos in viral_index. Continuing with the newest videos.")
+        after = position if position and position["t"] == RECENT_TIER and "p" in position else None
+        videos = await _read_recent(is_short, skip, limit, after, seen)
+        if videos:
+            last = videos[-1]
+            next_position = {"t": RECENT_TIER, "p": last["published_at"].isoformat(), "v": last["video_id"]}
+
+    headers = {}
+    if next_position:
+        headers["X-Next-Cursor"] = _encode_cursor(next_position)
+        tier = next_position["t"]
+        headers["X-Feed-Tier"] = tier if tier == RECENT_TIER else tier[0]
+
+    logger.info(f"Rendered feed page with {len(videos)} videos")
+    return pack(dumps([_format_video_for_feed(v) for v in videos]), headers)
+
+async def _load_candidates(state, language, is_short):
+    """
+    The top PERSONAL_CANDIDATES entries of every tier in the chain, deduplicated, as
+    [video_id, score, channel_id, niche]. Shared by all users and cached per index generation.
+    """
+    if candidate_store.ready:
+        candidates = {}
+        for tier in _tier_chain(state, language):
+            for _, c in candidate_store.page(tier, is_short, 0, settings.PERSONAL_CANDIDATES):
+                candidates.setdefault(c.video_id, [c.video_id, c.score, c.channel_id, c.niche])
+        return list(candidates.values())
+    scores = {}
+    for viral_type, tier_state, tier_language in _tier_chain(state, language):
+        query = {"viral_type": viral_type, "state": tier_state, "language": tier_language, "shorts": is_short}
+        cursor = async_viral_index_collection.find(query, {"_id": 0, "video_id": 1, "score": 1}).sort("rank", pymongo.ASCENDING).limit(settings.PERSONAL_CANDIDATES)
+        async for entry in cursor:
+            scores.setdefault(entry["video_id"], entry["score"])
+    if not scores:
+        return []
+    features = {
+        v["video_id"]: v async for v in async_videos_collection.find(
+            {"video_id": {"$in": list(scores)}}, {"_id": 0, "video_id": 1, "channel_id": 1, "niche": 1}
+        )
+    }
+    return [
+        [video_id, score, features.get(video_id, {}).get("channel_id"), features.get(video_id, {}).get("niche")]
+        for video_id, score in scores.items()
+    ]
+
+async def _get_candidates(state, language, is_short):
+    return await feed_cache.get_or_load(
+        ("candidates", candidate_store.cache_tag, state, language, is_short), lambda: _load_candidates(state, language, is_short)
+    )
+
+async def _build_personal_page(uid, state, language, limit, is_short, position):
+    """
+    Reranks the tier candidates for `uid`: watched videos are dropped and followed channels and
+    favourite niches are boosted. Returns (JSON body, headers), or None once no candidates are left.
+    The cursor is the last (personal score, video_id), so the next page seeks past it.
+    """
+    ranked = rerank(await _get_candidates(state, language, is_short), await affinity_cache.get(uid))
+    if position:
+        after = (-position["s"], position["v"])
+        ranked = [item for item in ranked if (-item[0], item[1]) > after]
+    page = ranked[:limit]
+    if not page:
+        return None
+    videos = await _load_videos([video_id for _, video_id in page])
+    headers = {
+        "X-Next-Cursor": _encode_cursor({"t": PERSONAL_TIER, "s": page[-1][0], "v": page[-1][1]}),
+        "X-Feed-Tier": PERSONAL_TIER,
+    }
+    return dumps([_format_video_for_feed(v) for v in videos]), headers
+
 @router.post("/feed")
-def get_feed(request: FeedRequest):
+async def get_feed(request: FeedRequest, token: Optional[str] = Depends(get_bearer_token)):
     """
     Gets a personalized feed with multi-level fallback and pagination.
+    Pages are served from the precomputed viral_index tiers, held in memory by the candidate
+    store once it is loaded; the videos collection is only sorted once every tier has been
+    scrolled through. Pages are rendered to JSON bytes once and kept in the shared feed cache
+    until they expire or the viral index is rebuilt; cache hits are sent as-is without re-encoding.
+
+    The body stays a plain list. The continuation token for the next page is returned in the
+    X-Next-Cursor header and the tier it belongs to in X-Feed-Tier. Sending that token back as
+    `cursor` seeks straight to the next page, so page N costs the same as page 1.
+
+    With `personalized` and a valid Authorization header, the same candidates are reranked for
+    the user (see _build_personal_page) and not cached. Once they run out, paging continues
+    with the shared feed, leaving out the candidates already shown and the user's watched videos.
     """
     try:
         state = request.state
         language = request.language
         limit = request.limit
-        skip = request.skip
         is_short = request.is_short
+        position = _decode_cursor(request.cursor) if request.cursor else None
+        skip = 0 if position else request.skip
         
-        logger.info(f"Feed request: state={state}, language={language}, skip={skip}, is_short={is_short}")
-        
-        videos = []
-        projection = {"_id": 0}
-        
-        def build_query(base_query):
-            if is_short is not None:
-                base_query["is_short"] = is_short
-            return base_query
-
-        def run_query(query):
-            return list(videos_collection.find(query, projection).sort("viral_score", pymongo.DESCENDING).skip(skip).limit(limit))
-
-        if state and language:
-            videos = run_query(build_query({"state": state, "language": language}))
-        
-        if not videos and language:
-            videos = run_query(build_query({"language": language}))
+        logger.info(f"Feed request: state={state}, language={language}, skip={skip}, cursor={position}, is_short={is_short}")
 
-        if not videos and state:
-            videos = run_query(build_query({"state": state}))
+        # Only personalized requests verify the token; signature checks are CPU-bound, so off the event loop
+        uid = await run_in_threadpool(verify_token, token) if request.personalized and token else None
+        if uid:
+            if position is None or position["t"] == PERSONAL_TIER:
+                page = await _build_personal_page(uid, state, language, limit, is_short, position)
+                if page:
+                    body, headers = page
+                    return RawJSONResponse(content=body, headers=headers)
+                position = None  # Every candidate was seen: continue with the shared feed from the top
+            # Past the candidates, the shared feed without them and without the user's watched videos; per user, so not cached
+            candidates = await _get_candidates(state, language, is_short)
+            exclude = (await affinity_cache.get(uid)).watched | {candidate[0] for candidate in candidates}
+            body, headers = unpack(await _build_feed_page(state, language, limit, 0, is_short, position, exclude=exclude))
+            return RawJSONResponse(content=body, headers=headers)
+        elif position and position["t"] == PERSONAL_TIER:
+            position = None
 
-        if not videos:
-            videos = run_query(build_query({}))
-
-        if not videos:
-            logger.info("No videos found with viral_score. Falling back to sorting by published_at.")
-            fallback_query = build_query({})
-            videos = list(videos_collection.find(fallback_query, projection).sort("published_at", pymongo.DESCENDING).skip(skip).limit(limit))
-
-        logger.info(f"Returning {len(videos)} videos")
-        
-        formatted_videos = [_format_video_for_feed(v) for v in videos]
-        return formatted_videos
+        cache_key = ("feed", candidate_store.cache_tag, state, language, is_short, limit, skip, request.cursor if position else None)
+        body, headers = unpack(await feed_cache.get_or_load(
+            cache_key, lambda: _build_feed_page(state, language, limit, skip, is_short, position)
+        ))
+        return RawJSONResponse(content=body, headers=headers)
 
     except Exception as e:
         logger.error(f"Error in get_feed: {e}")
@@ -93,12 +318,19 @@ def get_feed(request: FeedRequest):
         return []
 
 @router.get("/video/{video_id}")
-def get_video_details(video_id: str):
+async def get_video_details(video_id: str):
     logger.info(f"Fetching details for video_id: {video_id}")
-    projection = {"_id": 0}
-    video = videos_collection.find_one({"video_id": video_id}, projection)
-    
-    if not video:
+
+    candidate = candidate_store.get(video_id)
+    if candidate is not None:
+        return RawJSONResponse(content=dumps(_format_video_for_feed(candidate.feed_doc())))
+
+    async def load():
+        video = await async_videos_collection.find_one({"video_id": video_id}, FEED_PROJECTION)
+        return dumps(_format_video_for_feed(video)) if video else None
+
+    body = await feed_cache.get_or_load(("video", video_id), load)
+    if not body:
         raise HTTPException(status_code=404, detail="Video not found in database")
         
-    return _format_video_for_feed(video)
+    return RawJSONResponse(content=body)
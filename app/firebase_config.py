@@ -1,7 +1,11 @@
-import firebase_admin
-from firebase_admin import credentials, auth
 import os
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .config import settings
 
 # Path to the user data folder
 USER_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "user_data")
@@ -10,8 +14,18 @@ KEY_FILE_PATH = os.path.join(USER_DATA_DIR, "serviceAccountKey.json")
 # Cloud Deployment Strategy:
 # 1. Try to load from local file in 'user_data/serviceAccountKey.json' (Development)
 # 2. If not found, try to load from Environment Variable 'FIREBASE_CREDENTIALS' (Production/Cloud)
+#
+# The Admin SDK is imported and initialized on the first token check, not at import time,
+# so workers start serving without waiting for it.
+
+_app = None
+_init_lock = threading.Lock()
+
+
+def _initialize():
+    import firebase_admin
+    from firebase_admin import credentials
 
-try:
     if os.path.exists(KEY_FILE_PATH):
         # Local Development
         cred = credentials.Certificate(KEY_FILE_PATH)
@@ -32,17 +46,88 @@ try:
             else:
                 raise FileNotFoundError(f"No serviceAccountKey.json found in {USER_DATA_DIR} and FIREBASE_CREDENTIALS env var not set.")
 
-    firebase_admin.initialize_app(cred)
+    app = firebase_admin.initialize_app(cred)
     print("✅ Firebase Admin SDK initialized successfully.")
+    return app
+
+
+def get_firebase_app():
+    """Initializes the Firebase Admin SDK on first use and returns the app."""
+    global _app
+    if _app is None:
+        with _init_lock:
+            if _app is None:
+                try:
+                    _app = _initialize()
+                except Exception as e:
+                    print(f"🔥 Firebase Admin SDK Error: {e}")
+                    print(f"👉 Please ensure 'serviceAccountKey.json' is inside the '{USER_DATA_DIR}' folder.")
+                    raise
+    return _app
+
+
+class _VerifiedTokenCache:
+    """
+    LRU of already-verified ID tokens, keyed by SHA-256 of the token, holding the decoded
+    claims until the token's `exp`. Repeat requests with the same token skip the RSA check.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # token hash -> decoded claims
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+    def get(self, id_token):
+        key = self._key(id_token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is not None and claims.get("exp", 0) <= time.time():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                claims = None
+            if claims is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return claims
+
+    def put(self, id_token, claims):
+        if claims.get("exp", 0) <= time.time():
+            return
+        with self._lock:
+            self._entries[self._key(id_token)] = claims
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), maxsize=self.maxsize)
+
+
+token_cache = _VerifiedTokenCache(settings.TOKEN_CACHE_SIZE)
+
+
+def verify_id_token(id_token: str):
+    """Verifies a Firebase ID token and returns the decoded claims. Raises on invalid tokens."""
+    claims = token_cache.get(id_token)
+    if claims is not None:
+        return claims
+    from firebase_admin import auth
+    claims = auth.verify_id_token(id_token, app=get_firebase_app())
+    token_cache.put(id_token, claims)
+    return claims
 
-except Exception as e:
-    print(f"🔥 Firebase Admin SDK Error: {e}")
-    print(f"👉 Please ensure 'serviceAccountKey.json' is inside the '{USER_DATA_DIR}' folder.")
 
 def verify_token(id_token: str):
     """Verifies the Firebase ID token and returns the user's UID."""
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = verify_id_token(id_token)
         return decoded_token['uid']
     except Exception as e:
         return None
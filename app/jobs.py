@@ -0,0 +1,102 @@
+import datetime
+import time
+import logging
+
+from .database import job_runs_collection
+from .services.youtube_service import YouTubeService
+from .services.viral_engine import ViralEngine
+from .services.fetch_pipeline import FetchPipeline, RateLimiter, build_fetch_jobs
+from .services.fetch_planner import FetchPlanner
+from .services.stats_refresher import StatsRefresher
+from .services.job_lock import JobLock
+from .config import settings
+
+logger = logging.getLogger("uvicorn")
+
+COMPREHENSIVE_FETCH = "comprehensive_fetch"
+STATS_REFRESH = "stats_refresh"
+
+
+def comprehensive_fetch_job():
+    """
+    Background job to fetch videos for ALL defined niches, states, and languages.
+    """
+    logger.info("🚀 Starting comprehensive fetch job for all categories...")
+    yt_service = YouTubeService(rate_limiter=RateLimiter(settings.FETCH_REQUESTS_PER_SECOND))
+    yt_service.key_pool.refresh()  # Count what other processes spent since this pool was loaded
+    viral_engine = ViralEngine()
+
+    planner = FetchPlanner().load()
+    jobs = planner.plan(build_fetch_jobs(), budget=planner.sweep_budget(yt_service.key_pool.remaining()))
+    pipeline = FetchPipeline(yt_service, concurrency=settings.FETCH_CONCURRENCY, planner=planner)
+    stats = pipeline.run(jobs)
+    planner.flush()
+    yt_service.key_pool.flush()
+
+    logger.info("🧠 Updating all viral indices...")
+    viral_engine.update_viral_indices()
+    logger.info("✅ Comprehensive fetch job completed successfully.")
+    return dict(
+        yt_service.usage,
+        queries=stats["jobs"],
+        videos_ingested=stats["inserted"],
+        videos_updated=stats["modified"],
+        errors=stats["fetch_errors"] + stats["write_errors"] + stats["stages"]["parse"]["errors"],
+        stages=stats["stages"],
+    )
+
+
+def stats_refresh_job():
+    """
+    Background job to refresh counts and scores of ranked and recent videos, then rebuild the indices.
+    """
+    logger.info("📈 Starting stats refresh job...")
+    yt_service = YouTubeService(rate_limiter=RateLimiter(settings.FETCH_REQUESTS_PER_SECOND))
+    yt_service.key_pool.refresh()
+    result = StatsRefresher(yt_service).refresh()
+    yt_service.key_pool.flush()
+    if result["updated"]:
+        # The refresher already wrote the new scores and stored scores don't change with time,
+        # so rank from them without rescoring the whole collection
+        ViralEngine().update_viral_indices(rescore=False)
+    return dict(yt_service.usage, videos_ingested=0, videos_updated=result["updated"], errors=result["errors"])
+
+
+JOBS = {
+    COMPREHENSIVE_FETCH: comprehensive_fetch_job,
+    STATS_REFRESH: stats_refresh_job,
+}
+
+
+def run_job(name):
+    """
+    Runs the job `name` under its lock and records the run in `job_runs`: status, duration,
+    API calls, quota spent, videos ingested and errors. Returns the run document, or None when
+    another process holds the lock.
+    """
+    lock = JobLock(name)
+    if not lock.acquire():
+        logger.info(f"⏭️ Skipping '{name}': another run still holds its lock.")
+        return None
+
+    run = {"job": name, "owner": lock.owner, "status": "running", "started_at": datetime.datetime.utcnow()}
+    started = time.monotonic()
+    try:
+        run["_id"] = job_runs_collection.insert_one(dict(run)).inserted_id
+        run.update(JOBS[name]())
+        run["status"] = "success"
+    except Exception as e:
+        logger.error(f"❌ Job '{name}' failed with exception: {e}", exc_info=True)
+        run.update(status="failed", error=str(e))
+    finally:
+        lock.release()
+        run.update(finished_at=datetime.datetime.utcnow(), duration_seconds=round(time.monotonic() - started, 1))
+        if "_id" in run:
+            job_runs_collection.update_one({"_id": run["_id"]}, {"$set": run})
+    return run
+
+
+def schedule_jobs(scheduler):
+    """Adds every periodic job to an APScheduler scheduler."""
+    scheduler.add_job(run_job, 'interval', args=[COMPREHENSIVE_FETCH], minutes=settings.FETCH_INTERVAL_MINUTES, id=COMPREHENSIVE_FETCH)
+    scheduler.add_job(run_job, 'interval', args=[STATS_REFRESH], minutes=settings.STATS_REFRESH_MINUTES, id=STATS_REFRESH)
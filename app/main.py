@@ -1,13 +1,21 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
 import logging
+import threading
 
-from .database import videos_collection
-from .services.youtube_service import YouTubeService
-from .services.viral_engine import ViralEngine
+from .database import videos_collection, job_runs_collection, ensure_indexes, backfill_username_lower
+from .jobs import COMPREHENSIVE_FETCH, run_job, schedule_jobs
+from .services.job_lock import is_locked
+from .services.feed_cache import feed_cache
+from .services.activity_buffer import activity_buffer
+from .services.personalization import affinity_cache
+from .services.candidate_store import candidate_store
+from .firebase_config import token_cache
 from .config import settings
-from .constants import NICHES, STATES, LANGUAGES
 from .user_routes import router as user_router
 from .feed_routes import router as feed_router # Import the new feed router
 
@@ -24,6 +32,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Feed-Tier"],
 )
 
 # --- API Routers ---
@@ -31,61 +40,77 @@ app.include_router(user_router, prefix="/api", tags=["User"])
 app.include_router(feed_router, prefix="/api", tags=["Feed"]) # Add the feed router with /api prefix
 
 # --- Background Scheduler ---
+# Periodic jobs run in the worker process (`python -m app.worker`), not in every web worker,
+# unless RUN_SCHEDULER_IN_WEB is set for single-process deployments.
 scheduler = BackgroundScheduler()
 
-def comprehensive_fetch_job():
-    """
-    Background job to fetch videos for ALL defined niches, states, and languages.
-    """
-    logger.info("🚀 Starting comprehensive fetch job for all categories...")
+def database_warmup():
+    """Backfills normalized usernames, creates missing indexes and checks the database. Runs in the background so it never delays serving."""
     try:
-        yt_service = YouTubeService()
-        viral_engine = ViralEngine()
-        
-        for niche in NICHES:
-            for state in STATES:
-                for lang in LANGUAGES:
-                    query = f"{niche} {state} {lang}"
-                    logger.info(f"--> Fetching videos for: {niche} | {state} | {lang}")
-                    yt_service.fetch_videos(query=query, niche=niche, state=state, language=lang, max_results=50)
-        
-        logger.info("🧠 Updating all viral indices...")
-        viral_engine.update_viral_indices()
-        logger.info("✅ Comprehensive fetch job completed successfully.")
+        # Username lookup and search only match on username_lower, so users registered before it existed get it first
+        updated, conflicts = backfill_username_lower()
+        if updated or conflicts:
+            logger.info(f"✅ Set username_lower on {updated} users; {len(conflicts)} differ from another only by case and need a rename (see migrate.py).")
+        if settings.CREATE_INDEXES_ON_STARTUP:
+            created = ensure_indexes()
+            if created:
+                logger.info(f"✅ Created {len(created)} missing indexes: {created}")
+        count = videos_collection.estimated_document_count()
+        logger.info(f"✅ DATABASE CHECK: Found about {count} videos in 'videos' collection.")
+        if count == 0:
+            logger.warning("⚠️ DATABASE IS EMPTY! Please run the fetch job.")
     except Exception as e:
-        logger.error(f"❌ Job failed with exception: {e}", exc_info=True)
+        logger.error(f"❌ DATABASE CONNECTION ERROR: {e}")
 
 # --- App Lifecycle Events ---
 @app.on_event("startup")
 def start_scheduler():
-    scheduler.add_job(comprehensive_fetch_job, 'interval', minutes=60, id="comprehensive_fetch")
-    if not scheduler.running:
+    if settings.RUN_SCHEDULER_IN_WEB and not scheduler.running:
+        schedule_jobs(scheduler)
         scheduler.start()
         logger.info("Scheduler started.")
     
-    try:
-        count = videos_collection.count_documents({})
-        logger.info(f"✅ DATABASE CHECK: Found {count} videos in 'videos' collection.")
-        if count == 0:
-            logger.warning("⚠️ DATABASE IS EMPTY! Please run the fetch job.")
-    except Exception as e:
-        logger.error(f"❌ DATABASE CONNECTION ERROR: {e}")
+    threading.Thread(target=database_warmup, name="database-warmup", daemon=True).start()
+    if settings.CANDIDATE_STORE_ENABLED:
+        candidate_store.start()
+    app.state.startup_seconds = time.perf_counter() - _IMPORT_STARTED
+    logger.info(f"⏱️ App ready {app.state.startup_seconds * 1000:.0f} ms after import started.")
 
 @app.on_event("shutdown")
 def shutdown_scheduler():
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler shut down.")
+    activity_buffer.flush()
 
 # --- Root and Admin Endpoints ---
 @app.get("/")
 def read_root():
     """Health check endpoint."""
-    return {"status": "Triangle Backend is running", "version": settings.PROJECT_VERSION}
+    return {
+        "status": "Triangle Backend is running",
+        "version": settings.PROJECT_VERSION,
+        "startup_ms": round(getattr(app.state, "startup_seconds", 0) * 1000),
+    }
 
 @app.get("/admin/trigger-fetch")
 def trigger_fetch_manual(background_tasks: BackgroundTasks):
-    """Manually triggers the comprehensive data collection job in the background."""
+    """Manually triggers the comprehensive data collection job in the background, unless a sweep is already running."""
+    if is_locked(COMPREHENSIVE_FETCH):
+        return {"status": "A comprehensive fetch job is already running. Check /admin/job-runs for progress."}
     logger.info("Manual fetch triggered via API. Adding to background tasks.")
-    background_tasks.add_task(comprehensive_fetch_job)
+    background_tasks.add_task(run_job, COMPREHENSIVE_FETCH)
     return {"status": "Comprehensive fetch job started in the background. Check server logs for progress."}
+
+@app.get("/admin/job-runs")
+def job_runs(limit: int = 20):
+    """The most recent job runs with their duration, API calls, quota spent, videos ingested and errors."""
+    return list(job_runs_collection.find({}, {"_id": 0}).sort("started_at", -1).limit(min(limit, 100)))
+
+@app.get("/admin/cache-stats")
+def cache_stats():
+    """Hit, miss and eviction counters for the feed, verified-token and user affinity caches, and candidate store memory."""
+    return {
+        "feed_cache": feed_cache.stats(), "token_cache": token_cache.stats(),
+        "affinity_cache": affinity_cache.stats(), "candidate_store": candidate_store.stats(),
+    }
@@ -37,6 +37,7 @@ class ViralIndexModel(BaseModel):
     last_updated: datetime = Field(default_factory=datetime.utcnow)
     state: Optional[str] = None
     language: Optional[str] = None
+    is_short: bool = False
 
 class ApiKeyUsageModel(BaseModel):
     api_key: str
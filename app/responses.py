@@ -0,0 +1,31 @@
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder produces the same JSON, just slower
+    orjson = None
+
+
+def dumps(content):
+    """Encodes `content` to JSON bytes once, so cached responses never go through jsonable_encoder again."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class RawJSONResponse(Response):
+    """A JSON response whose body is already-encoded bytes. Nothing is validated or re-encoded per request."""
+    media_type = "application/json"
+
+
+def pack(body, headers=None):
+    """Stores a rendered body and its response headers in one bytes value for the cache."""
+    return json.dumps(headers or {}).encode("utf-8") + b"\n" + body
+
+
+def unpack(blob):
+    """Inverse of pack(). Returns (body, headers)."""
+    header_line, _, body = blob.partition(b"\n")
+    return body, json.loads(header_line)
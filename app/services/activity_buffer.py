@@ -0,0 +1,136 @@
+import datetime
+import threading
+import atexit
+import logging
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ..database import user_activity_collection
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+# Event types the activity endpoint accepts. Every event also adds its duration_watched.
+EVENT_TYPES = {"view", "replay", "like", "unlike", "pause"}
+
+
+class ActivityBuffer:
+    """
+    Merges watch events in memory per (uid, video_id) and writes each pair once per flush:
+    counters are summed into one $inc, the latest like/unlike and pause win, so a flush sends
+    one upsert per distinct video watched however many raw events arrived.
+
+    A daemon thread flushes every `flush_interval` seconds, or early once `max_keys` pairs
+    are pending, with one unordered bulk_write.
+    """
+    def __init__(self, collection=None, flush_interval=None, max_keys=None):
+        self.collection = collection if collection is not None else user_activity_collection
+        self.flush_interval = flush_interval or settings.ACTIVITY_FLUSH_SECONDS
+        self.max_keys = max_keys or settings.ACTIVITY_BUFFER_MAX_KEYS
+        self._pending = {}  # (uid, video_id) -> {"inc": {...}, "set": {...}, "last_event_at": datetime}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {"events": 0, "flushes": 0, "upserts": 0, "failed": 0}
+
+    def add(self, uid, events):
+        """Merges a batch of events (dicts with video_id, event_type, duration_watched, paused_at) for one user."""
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            for event in events:
+                entry = self._pending.get((uid, event["video_id"]))
+                if entry is None:
+                    entry = self._pending[(uid, event["video_id"])] = {"inc": {}, "set": {}}
+                self._merge(entry, event)
+                entry["last_event_at"] = now
+            self.stats["events"] += len(events)
+            full = len(self._pending) >= self.max_keys
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    @staticmethod
+    def _merge(entry, event):
+        inc, updates = entry["inc"], entry["set"]
+        event_type = event["event_type"]
+        if event.get("duration_watched"):
+            inc["watch_seconds"] = inc.get("watch_seconds", 0) + event["duration_watched"]
+        if event_type == "view":
+            inc["view_count"] = inc.get("view_count", 0) + 1
+        elif event_type == "replay":
+            inc["replay_count"] = inc.get("replay_count", 0) + 1
+        elif event_type in ("like", "unlike"):
+            updates["liked"] = event_type == "like"
+        elif event_type == "pause" and event.get("paused_at") is not None:
+            updates["paused_at"] = event["paused_at"]
+
+    @staticmethod
+    def _merge_entries(into, entry):
+        for field, amount in entry["inc"].items():
+            into["inc"][field] = into["inc"].get(field, 0) + amount
+        # Newer values already in `into` win over the ones being put back
+        into["set"] = dict(entry["set"], **into["set"])
+        into["last_event_at"] = max(into.get("last_event_at", entry["last_event_at"]), entry["last_event_at"])
+
+    def _ops(self, pending):
+        ops = []
+        for (uid, video_id), entry in pending.items():
+            update = {
+                "$setOnInsert": {"created_at": entry["last_event_at"]},
+                "$max": {"last_event_at": entry["last_event_at"]},
+            }
+            if entry["inc"]:
+                update["$inc"] = entry["inc"]
+            if entry["set"]:
+                update["$set"] = entry["set"]
+            ops.append(UpdateOne({"uid": uid, "video_id": video_id}, update, upsert=True))
+        return ops
+
+    def flush(self):
+        """Writes every pending pair with one unordered bulk_write. Returns the number of pairs sent."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self.collection.bulk_write(self._ops(pending), ordered=False)
+            failed = 0
+        except BulkWriteError as e:
+            failed = len(e.details.get("writeErrors", []))
+            logger.warning(f"Activity flush had {failed} failed upserts.")
+        except Exception as e:
+            # Nothing was confirmed written: merge the events back so the next flush retries them
+            logger.error(f"Activity flush failed, keeping {len(pending)} pairs for the next flush: {e}")
+            with self._lock:
+                for key, entry in pending.items():
+                    if key in self._pending:
+                        self._merge_entries(self._pending[key], entry)
+                    else:
+                        self._pending[key] = entry
+            return 0
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["upserts"] += len(pending) - failed
+            self.stats["failed"] += failed
+        return len(pending)
+
+    def _flush_forever(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._flush_forever, name="activity-flush", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+
+activity_buffer = ActivityBuffer()
@@ -0,0 +1,92 @@
+import threading
+import time
+import logging
+from pymongo.errors import BulkWriteError
+
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+
+class BulkWriter:
+    """
+    Buffers write operations (UpdateOne, InsertOne, ...) per collection and sends them with
+    unordered `bulk_write` once `max_ops` operations are pending or `max_interval` seconds have
+    passed since the last flush.
+
+    Operations added with a `key` replace any pending operation with the same key, so repeated
+    upserts of the same document inside one batch cost a single write. Each flush reports the
+    (collection name, key) of the operations that failed, so callers can tell what was written.
+    """
+    def __init__(self, max_ops=None, max_interval=None):
+        self.max_ops = max_ops or settings.BULK_WRITE_BATCH_SIZE
+        self.max_interval = max_interval if max_interval is not None else settings.BULK_WRITE_MAX_INTERVAL_SECONDS
+        self.totals = {"batches": 0, "inserted": 0, "modified": 0, "failed": 0}
+        self._pending = {}  # collection name -> (collection, {key: op})
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, collection, op, key=None):
+        """Queues one operation. Returns the batch result if this call triggered a flush, else None."""
+        with self._lock:
+            _, ops = self._pending.setdefault(collection.name, (collection, {}))
+            if key is None:
+                key = ("__seq__", self._count)
+            if key not in ops:
+                self._count += 1
+            ops[key] = op
+            full = self._count >= self.max_ops
+        if full:
+            return self.flush()
+        return None
+
+    def pending(self):
+        """Number of operations waiting for the next flush."""
+        with self._lock:
+            return self._count
+
+    def flush_if_due(self):
+        """Flushes when the time limit has passed. Meant to be called from a writer loop."""
+        if self._count and time.monotonic() - self._last_flush >= self.max_interval:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """
+        Sends all pending operations and returns {"inserted", "modified", "failed"} for this batch,
+        plus "failed_keys": the (collection name, key) of every operation that was not written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._count = 0
+            self._last_flush = time.monotonic()
+
+        result = {"inserted": 0, "modified": 0, "failed": 0}
+        failed_keys = set()
+        for collection, ops in pending.values():
+            if not ops:
+                continue
+            keys = list(ops)
+            try:
+                res = collection.bulk_write(list(ops.values()), ordered=False)
+                details = res.bulk_api_result
+            except BulkWriteError as e:
+                details = e.details
+                logger.warning(f"bulk_write on '{collection.name}' had {len(details.get('writeErrors', []))} failed operations.")
+            except Exception as e:
+                logger.error(f"bulk_write on '{collection.name}' failed: {e}")
+                result["failed"] += len(ops)
+                failed_keys.update((collection.name, key) for key in keys)
+                continue
+            result["inserted"] += details.get("nInserted", 0) + details.get("nUpserted", 0)
+            result["modified"] += details.get("nModified", 0)
+            result["failed"] += len(details.get("writeErrors", []))
+            failed_keys.update((collection.name, keys[error["index"]]) for error in details.get("writeErrors", []))
+
+        if any(result.values()):
+            with self._lock:
+                self.totals["batches"] += 1
+                for name, value in result.items():
+                    self.totals[name] += value
+        return dict(result, failed_keys=failed_keys)
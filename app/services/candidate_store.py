@@ -0,0 +1,184 @@
+import sys
+import time
+import bisect
+import threading
+import logging
+
+from ..database import videos_collection, viral_index_collection
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+# Display and ranking fields kept per candidate; description, tags and the rest stay in MongoDB
+CANDIDATE_PROJECTION = {
+    "_id": 0, "video_id": 1, "title": 1, "channel_id": 1, "channel_title": 1, "channel_thumbnail": 1,
+    "like_count": 1, "comment_count": 1, "is_short": 1, "niche": 1, "state": 1, "language": 1
+}
+
+
+class Candidate:
+    """One ranked video. Slots instead of a dict, and repeated strings (channels, states...) are interned."""
+    __slots__ = ("video_id", "score", "title", "channel_id", "channel_title", "channel_thumbnail",
+                 "like_count", "comment_count", "is_short", "niche", "state", "language")
+
+    def __init__(self, doc, score):
+        intern = lambda value: sys.intern(value) if isinstance(value, str) else value
+        self.video_id = doc["video_id"]
+        self.score = score
+        self.title = doc.get("title")
+        self.channel_id = intern(doc.get("channel_id"))
+        self.channel_title = intern(doc.get("channel_title"))
+        self.channel_thumbnail = intern(doc.get("channel_thumbnail"))
+        self.like_count = doc.get("like_count", 0)
+        self.comment_count = doc.get("comment_count", 0)
+        self.is_short = bool(doc.get("is_short", False))
+        self.niche = intern(doc.get("niche"))
+        self.state = intern(doc.get("state"))
+        self.language = intern(doc.get("language"))
+
+    def feed_doc(self):
+        """The fields _format_video_for_feed reads, as a document."""
+        return {
+            "video_id": self.video_id, "title": self.title, "channel_title": self.channel_title,
+            "channel_thumbnail": self.channel_thumbnail, "like_count": self.like_count,
+            "comment_count": self.comment_count, "is_short": self.is_short,
+        }
+
+
+class _TierList:
+    """One ranking of a tier in rank order, as parallel lists."""
+    __slots__ = ("ranks", "candidates")
+
+    def __init__(self, ranks, candidates):
+        self.ranks = ranks
+        self.candidates = candidates
+
+    def page(self, skip, limit, after_rank=None):
+        start = bisect.bisect_right(self.ranks, after_rank) if after_rank is not None else 0
+        start += skip
+        return list(zip(self.ranks[start:start + limit], self.candidates[start:start + limit]))
+
+
+class CandidateStore:
+    """
+    Every video in viral_index, held in memory as Candidate objects, with O(1) lookup by
+    video_id and by tier. Feed pages and /api/video are answered from here without a query.
+
+    Loaded from MongoDB whenever a rebuilt viral_index is swapped in: a background thread
+    compares the index's last_updated every CANDIDATE_STORE_REFRESH_SECONDS, so web
+    processes pick up rebuilds made by the worker process.
+    """
+    def __init__(self, viral_index=None, videos=None):
+        self.viral_index = viral_index if viral_index is not None else viral_index_collection
+        self.videos = videos if videos is not None else videos_collection
+        self.version = None
+        self._by_id = {}
+        self._tiers = {}  # (viral_type, state, language, shorts) -> _TierList
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    @property
+    def cache_tag(self):
+        """
+        The loaded index version, for feed cache keys. Pages built from this store are only
+        served to processes holding the same version; the rebuild's own generation bump clears
+        the shared cache once, and a process that has not reloaded yet cannot overwrite new pages.
+        """
+        return self.version.isoformat() if self.version else None
+
+    def get(self, video_id):
+        return self._by_id.get(video_id)
+
+    def page(self, tier, is_short, skip, limit, after_rank=None):
+        """One page of (rank, Candidate) from a tier's ranking for `is_short`, like feed_routes._read_tier."""
+        tier_list = self._tiers.get(tuple(tier) + (is_short,))
+        return tier_list.page(skip, limit, after_rank) if tier_list else []
+
+    def video_ids(self, tier, is_short):
+        """Every video_id in a tier's ranking for `is_short`."""
+        tier_list = self._tiers.get(tuple(tier) + (is_short,))
+        return {c.video_id for c in tier_list.candidates} if tier_list else set()
+
+    def load(self):
+        """Reads the current viral_index and the display fields of its videos, then swaps them in."""
+        started = time.monotonic()
+        entries = list(self.viral_index.find(
+            {}, {"_id": 0, "video_id": 1, "viral_type": 1, "state": 1, "language": 1, "shorts": 1, "rank": 1, "score": 1, "last_updated": 1}
+        ))
+        if not entries:
+            return False
+        video_ids = list({entry["video_id"] for entry in entries})
+        self.build(entries, self.videos.find({"video_id": {"$in": video_ids}}, CANDIDATE_PROJECTION))
+        memory = self.memory()
+        logger.info(f"🗃️ Candidate store loaded {memory['videos']} videos in {memory['tiers']} tier rankings in {time.monotonic() - started:.2f}s ({memory['bytes_per_100k'] / 2**20:.1f} MiB per 100k videos).")
+        return True
+
+    def build(self, entries, docs):
+        """Replaces the store with viral_index `entries` and the matching video `docs`, without queries."""
+        scores = {}
+        for entry in entries:
+            scores.setdefault(entry["video_id"], entry["score"])
+        by_id = {doc["video_id"]: Candidate(doc, scores[doc["video_id"]]) for doc in docs if doc["video_id"] in scores}
+
+        grouped = {}
+        for entry in entries:
+            candidate = by_id.get(entry["video_id"])
+            if candidate is not None:
+                key = (entry["viral_type"], entry.get("state"), entry.get("language"), entry.get("shorts"))
+                grouped.setdefault(key, []).append((entry["rank"], candidate))
+        tiers = {}
+        for key, ranked in grouped.items():
+            ranked.sort(key=lambda item: item[0])
+            tiers[key] = _TierList([r for r, c in ranked], [c for r, c in ranked])
+
+        with self._lock:
+            self._by_id, self._tiers, self.version = by_id, tiers, entries[0].get("last_updated")
+
+    def refresh(self):
+        """Reloads when viral_index has been rebuilt since the last load. Returns True if it reloaded."""
+        latest = self.viral_index.find_one({}, {"_id": 0, "last_updated": 1})
+        if latest is None or (self.ready and latest.get("last_updated") == self.version):
+            return False
+        return self.load()
+
+    def _refresh_forever(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Candidate store refresh failed: {e}")
+            time.sleep(settings.CANDIDATE_STORE_REFRESH_SECONDS)
+
+    def start(self):
+        """Loads in a background thread and keeps the store in step with viral_index rebuilds."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_forever, name="candidate-store", daemon=True)
+            self._thread.start()
+
+    def memory(self):
+        """Approximate bytes held: candidate objects, their unique strings and ints, and the tier lists."""
+        by_id, tiers = self._by_id, self._tiers
+        seen = set()
+        total = sys.getsizeof(by_id)
+        for candidate in by_id.values():
+            total += sys.getsizeof(candidate)
+            for name in Candidate.__slots__:
+                value = getattr(candidate, name)
+                if value is not None and not isinstance(value, bool) and id(value) not in seen:
+                    seen.add(id(value))
+                    total += sys.getsizeof(value)
+        for tier_list in tiers.values():
+            total += sys.getsizeof(tier_list.ranks) + sys.getsizeof(tier_list.candidates)
+        count = len(by_id)
+        return {"videos": count, "tiers": len(tiers), "bytes": total,
+                "bytes_per_100k": round(total / count * 100_000) if count else 0}
+
+    def stats(self):
+        return dict(self.memory(), version=self.cache_tag)
+
+
+candidate_store = CandidateStore()
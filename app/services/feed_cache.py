@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+class CacheBackend(ABC):
+    """
+    Storage used by FeedCache. Backends hold the entries and the generation counter;
+    FeedCache adds single-flight loading and hit/miss counters on top.
+
+    Values must be bytes (stored as-is) or JSON-serializable, so any backend can store them.
+    Backends whose calls can block (`blocking`) are called from a thread, off the event loop.
+    """
+    blocking = False
+
+    @abstractmethod
+    def get(self, key):
+        """Returns (found, value) for an unexpired entry of the current generation."""
+
+    @abstractmethod
+    def set(self, key, value, ttl, generation):
+        """Stores `value` unless the generation has moved on since `generation` was read."""
+
+    @abstractmethod
+    def generation(self):
+        """Returns the current generation."""
+
+    @abstractmethod
+    def bump_generation(self):
+        """Invalidates every entry. Returns the new generation."""
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU. Fastest, but every worker keeps its own cold copy."""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._generation = 0
+        self._entries = OrderedDict()  # key -> (generation, expires_at, value)
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            generation, expires_at, value = entry
+            if generation != self._generation or expires_at <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (generation, time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            return self._generation
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "size": len(self._entries), "evictions": self._evictions}
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Cache in a local SQLite file shared by every worker process on the machine.
+
+    One warm copy serves all uvicorn workers, and a single generation bump from the process
+    that rebuilt the viral index invalidates it for everyone. When the cache is full, the
+    entries closest to expiry are evicted first. With a fixed TTL that means the oldest writes go first.
+
+    Reads and writes give up after `timeout` seconds when other processes hold the lock, and
+    FeedCache treats that as a miss; only bump_generation waits up to GENERATION_BUMP_TIMEOUT.
+    """
+    blocking = True
+    GENERATION_BUMP_TIMEOUT = 5
+
+    def __init__(self, path, maxsize, timeout=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.timeout = timeout if timeout is not None else settings.FEED_CACHE_TIMEOUT_SECONDS
+        self._evictions = 0
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(f"PRAGMA busy_timeout = {self.GENERATION_BUMP_TIMEOUT * 1000}")
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value NOT NULL, generation INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires_at > ? "
+            "AND generation = (SELECT value FROM meta WHERE name = 'generation')",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return False, None
+        value = row[0]
+        return True, value if isinstance(value, bytes) else json.loads(value)
+
+    def set(self, key, value, ttl, generation):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, generation, expires_at) "
+            "SELECT ?, ?, ?, ? WHERE (SELECT value FROM meta WHERE name = 'generation') = ?",
+            (key, value if isinstance(value, bytes) else json.dumps(value), generation, time.time() + ttl, generation),
+        )
+        overflow = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.maxsize
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY expires_at LIMIT ?)",
+                (overflow,),
+            )
+            self._evictions += overflow
+
+    def generation(self):
+        return self._connect().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+    def bump_generation(self):
+        conn = self._connect()
+        # Invalidation must not be skipped, so it waits longer for the lock than reads and writes
+        conn.execute(f"PRAGMA busy_timeout = {self.GENERATION_BUMP_TIMEOUT * 1000}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            conn.execute("DELETE FROM entries")
+            generation = conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        return generation
+
+    def stats(self):
+        size = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "size": size, "evictions": self._evictions}
+
+
+BACKENDS = {
+    "memory": lambda: MemoryBackend(settings.FEED_CACHE_SIZE),
+    "sqlite": lambda: SQLiteBackend(
+        settings.FEED_CACHE_PATH or os.path.join(tempfile.gettempdir(), "triangle_feed_cache.sqlite3"),
+        settings.FEED_CACHE_SIZE,
+    ),
+}
+
+
+class FeedCache:
+    """
+    TTL cache for ready-to-serialize feed and video-detail responses on a pluggable backend.
+
+    - Entries are tagged with the generation they were built in. `bump_generation()` is called
+      when the viral index is rebuilt, which makes every older entry a miss at once.
+    - `get_or_load` coalesces concurrent misses for the same key into one load (single flight),
+      so an expiring hot page does not send a burst of identical queries to MongoDB.
+    - A failing backend call (e.g. a locked SQLite file) counts as a miss and is never raised
+      to the request. A backend that cannot be created at all is replaced by a MemoryBackend.
+    """
+    def __init__(self, backend=None, ttl=None):
+        self._backend = backend
+        self.ttl = ttl if ttl is not None else settings.FEED_CACHE_TTL_SECONDS
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    @property
+    def backend(self):
+        # Created on first use so importing this module never touches the disk
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._create_backend()
+        return self._backend
+
+    def _create_backend(self):
+        try:
+            return BACKENDS[settings.FEED_CACHE_BACKEND]()
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.error(f"Feed cache backend '{settings.FEED_CACHE_BACKEND}' could not be created, using a per-process memory cache: {e}")
+            return MemoryBackend(settings.FEED_CACHE_SIZE)
+
+    async def _get_backend(self):
+        """The backend, created in a thread on first use, since opening a backend can block."""
+        if self._backend is None:
+            return await asyncio.to_thread(lambda: self.backend)
+        return self._backend
+
+    def bump_generation(self):
+        return self.backend.bump_generation()
+
+    async def _call(self, method, *args, default=None):
+        """Calls a backend method, in a thread for blocking backends. Returns `default` if it fails."""
+        backend = await self._get_backend()
+        try:
+            if backend.blocking:
+                return await asyncio.to_thread(getattr(backend, method), *args)
+            return getattr(backend, method)(*args)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Feed cache {method} failed, serving without the cache: {e}")
+            return default
+
+    async def get_or_load(self, key, loader):
+        """
+        Returns the cached value for `key`, awaiting `loader()` at most once across concurrent
+        misses in this worker. Other requests for the same key await the same future.
+        """
+        key = json.dumps(key)
+        found, value = await self._call("get", key, default=(False, None))
+        if found:
+            self._stats["hits"] += 1
+            return value
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(flight)
+
+        self._stats["misses"] += 1
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            generation = await self._call("generation")
+            value = await loader()
+            if generation is not None:
+                await self._call("set", key, value, self.ttl, generation)
+            flight.set_result(value)
+            return value
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        except BaseException:
+            flight.cancel()  # The leading request was cancelled; waiters must not hang
+            raise
+        finally:
+            self._flights.pop(key, None)
+
+    def stats(self):
+        try:
+            backend = self.backend
+            backend_stats = dict(backend.stats(), generation=backend.generation())
+        except Exception as e:
+            self._stats["errors"] += 1
+            backend_stats = {"backend_error": str(e)}
+        with self._lock:
+            counters = dict(self._stats)
+        return dict(counters, ttl_seconds=self.ttl, **backend_stats)
+
+
+feed_cache = FeedCache()
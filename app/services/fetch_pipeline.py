@@ -0,0 +1,312 @@
+import datetime
+import queue
+import threading
+import time
+import logging
+
+from ..config import settings
+from ..database import videos_collection
+from ..constants import NICHES, STATES, LANGUAGES
+from .bulk_writer import BulkWriter
+
+logger = logging.getLogger("uvicorn")
+
+_STOP = object()
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every fetch worker.
+    `acquire()` blocks until a request may be sent, so the whole sweep never exceeds `rate` requests/second.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def build_fetch_jobs():
+    """Returns every (query, niche, state, language) combination swept by the fetch job."""
+    return [
+        (f"{niche} {state} {lang}", niche, state, lang)
+        for niche in NICHES
+        for state in STATES
+        for lang in LANGUAGES
+    ]
+
+
+def load_known_video_ids(days=7):
+    """
+    The ids of stored videos published inside the search window. Searches never return anything
+    older, so this small set is enough to drop already-stored videos before hydration.
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    known = {v["video_id"] for v in videos_collection.find({"published_at": {"$gte": since}}, {"_id": 0, "video_id": 1})}
+    logger.info(f"Loaded {len(known)} known video ids published since {since:%Y-%m-%d %H:%M}.")
+    return known
+
+
+class Stage:
+    """
+    One pipeline stage: `workers` threads take items from a bounded inbox and call
+    `handle(item, local)`, where `local` is a per-worker dict. A handler passes results on with
+    `stage.emit(result)`, which blocks while the next stage's inbox is full, so a slow stage
+    throttles the stages before it instead of buffering without limit.
+
+    `on_idle(local)` runs when the inbox stays empty for `poll_interval` seconds, and
+    `on_exit(local)` once per worker at shutdown. Counters feed `stats()`.
+    """
+    def __init__(self, name, handle, workers, queue_size, downstream=None, poll_interval=None, on_idle=None, on_exit=None):
+        self.name = name
+        self.handle = handle
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.downstream = downstream
+        self.poll_interval = poll_interval
+        self.on_idle = on_idle
+        self.on_exit = on_exit
+        self.counters = {"processed": 0, "emitted": 0, "errors": 0, "busy_seconds": 0.0, "max_depth": 0}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started = None
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def put(self, item):
+        self.inbox.put(item)
+        depth = self.inbox.qsize()
+        if depth > self.counters["max_depth"]:
+            with self._lock:
+                self.counters["max_depth"] = max(self.counters["max_depth"], depth)
+
+    def emit(self, item):
+        self._count(emitted=1)
+        self.downstream.put(item)
+
+    def _work(self):
+        local = {}
+        try:
+            while True:
+                try:
+                    item = self.inbox.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    if self.on_idle:
+                        self.on_idle(local)
+                    continue
+                if item is _STOP:
+                    return
+                started = time.monotonic()
+                try:
+                    self.handle(item, local)
+                except Exception as e:
+                    logger.error(f"Stage '{self.name}' failed on an item: {e}")
+                    self._count(errors=1)
+                self._count(processed=1, busy_seconds=time.monotonic() - started)
+        finally:
+            if self.on_exit:
+                self.on_exit(local)
+
+    def start(self):
+        self._started = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{self.name}-{n}", daemon=True) for n in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        """Stops the workers once the inbox is drained, then closes the next stage."""
+        for _ in self._threads:
+            self.inbox.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        if self.downstream:
+            self.downstream.close()
+
+    def stats(self):
+        """Queue depth, throughput (items/s) and utilization (busy share of worker time) so far."""
+        with self._lock:
+            counters = dict(self.counters)
+        elapsed = max(time.monotonic() - self._started, 1e-9) if self._started else 0
+        return dict(
+            counters,
+            workers=self.workers,
+            depth=self.inbox.qsize(),
+            busy_seconds=round(counters["busy_seconds"], 1),
+            throughput=round(counters["processed"] / elapsed, 1) if elapsed else 0.0,
+            utilization=round(counters["busy_seconds"] / (elapsed * self.workers), 2) if elapsed else 0.0,
+        )
+
+
+class FetchPipeline:
+    """
+    Runs a sweep as three stages connected by bounded queues:
+
+        fetch (HTTP search + videos.list) -> parse (build and score upserts) -> write (BulkWriter)
+
+    Each stage has its own worker count (FETCH_CONCURRENCY, FETCH_PARSE_WORKERS and
+    FETCH_WRITE_WORKERS). When a stage falls behind, its inbox fills up, and the stage before it
+    blocks. Memory stays flat, and the sweep never outruns MongoDB. Each stage reports its queue
+    depth and throughput every FETCH_STAGE_REPORT_SECONDS and in the final stats, which shows
+    which stage is the bottleneck.
+
+    A job's yield and watermark are recorded only once all of its writes have been flushed. If
+    any of them failed, nothing is recorded, and its videos are dropped from `known_ids`, so the
+    next sweep searches that window again and hydrates them.
+    """
+    def __init__(self, yt_service, concurrency=None, queue_size=None, planner=None, parse_workers=None, write_workers=None):
+        self.yt_service = yt_service
+        self.planner = planner
+        self.known_ids = set()
+        self.concurrency = concurrency or settings.FETCH_CONCURRENCY
+        self.parse_workers = parse_workers or settings.FETCH_PARSE_WORKERS
+        self.write_workers = write_workers or settings.FETCH_WRITE_WORKERS
+        self.queue_size = queue_size or settings.FETCH_WRITE_QUEUE_SIZE
+        self.stats = {"jobs": 0, "videos": 0, "fetch_errors": 0, "write_errors": 0,
+                      "inserted": 0, "modified": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _fetch(self, job, local):
+        query, niche, state, language = job
+        fetched_at = datetime.datetime.utcnow()
+        published_after = self.planner.published_after(job) if self.planner else None
+        try:
+            items = self.yt_service.fetch_video_items(
+                query=query, niche=niche, state=state, language=language, max_results=50,
+                published_after=published_after, known_ids=self.known_ids,
+            )
+        except Exception as e:
+            logger.error(f"Fetch failed for '{niche} | {state} | {language}': {e}")
+            items = None
+        if items is None:
+            self._count("fetch_errors")
+            return  # Nothing was fetched, so the watermark and yield stay as they were
+        self._count("jobs")
+        # Later queries in this sweep skip hydrating videos another query already found.
+        # _settle_writes drops them again if their write fails.
+        with self._stats_lock:
+            self.known_ids.update(item["id"] for item in items)
+        if items:
+            self.fetch_stage.emit((job, items, fetched_at))
+        elif self.planner:
+            self.planner.record(job, 0, [], fetched_at)
+
+    def _parse(self, batch, local):
+        job, items, fetched_at = batch
+        _, niche, state, language = job
+        ops, scores = self.yt_service.build_page_ops(items, niche, state, language)
+        self.parse_stage.emit((job, ops, scores, fetched_at, [item["id"] for item in items]))
+
+    def _write(self, batch, local):
+        writer = local.get("writer")
+        if writer is None:
+            writer = local["writer"] = BulkWriter()
+            local["jobs"], local["failed_keys"] = [], set()
+        job, ops, scores, fetched_at, video_ids = batch
+        _, niche, state, language = job
+        try:
+            # Flush before a job that would not fit, so each flush ends on a job boundary
+            if writer.pending() and writer.pending() + len(ops) > writer.max_ops:
+                self._settle_writes(local, writer.flush())
+            keys = {(collection.name, key) for collection, op, key in ops}
+            local["jobs"].append((job, keys, video_ids, scores, fetched_at))
+            for collection, op, key in ops:
+                self._settle_writes(local, writer.add(collection, op, key=key))
+            self._count("videos", len(scores))
+            self._settle_writes(local, writer.flush_if_due())
+        except Exception as e:
+            logger.error(f"Write failed for '{niche} | {state} | {language}': {e}")
+            self._count("write_errors", len(scores))
+
+    def _settle_writes(self, local, result):
+        """
+        Takes a flush result. Once nothing is left pending, records each job whose writes all
+        succeeded, and un-marks the videos of the others so they are fetched again.
+        """
+        if result is None:
+            return
+        local["failed_keys"].update(result["failed_keys"])
+        if local["writer"].pending():
+            return
+        for job, keys, video_ids, scores, fetched_at in local["jobs"]:
+            if keys & local["failed_keys"]:
+                logger.warning(f"Writes failed for '{' | '.join(job[1:])}'; its watermark stays for the next sweep.")
+                with self._stats_lock:
+                    self.known_ids.difference_update(video_ids)
+            elif self.planner:
+                self.planner.record(job, len(scores), scores, fetched_at)
+        local["jobs"], local["failed_keys"] = [], set()
+
+    def _flush_if_due(self, local):
+        if "writer" in local:
+            self._settle_writes(local, local["writer"].flush_if_due())
+
+    def _finish_writes(self, local):
+        writer = local.get("writer")
+        if writer is None:
+            return
+        self._settle_writes(local, writer.flush())
+        self._count("inserted", writer.totals["inserted"])
+        self._count("modified", writer.totals["modified"])
+        self._count("write_errors", writer.totals["failed"])
+
+    def stage_stats(self):
+        return {stage.name: stage.stats() for stage in (self.fetch_stage, self.parse_stage, self.write_stage)}
+
+    def _report_forever(self, done):
+        while not done.wait(settings.FETCH_STAGE_REPORT_SECONDS):
+            report = ", ".join(
+                f"{name}: depth {s['depth']}, {s['throughput']}/s, {s['utilization']:.0%} busy"
+                for name, s in self.stage_stats().items()
+            )
+            logger.info(f"📊 Fetch stages: {report}")
+
+    def run(self, jobs):
+        """Fetches every job and blocks until all results are written. Returns the run stats."""
+        started = time.monotonic()
+        self.known_ids = load_known_video_ids()
+        self.write_stage = Stage(
+            "write", self._write, self.write_workers, self.queue_size,
+            poll_interval=settings.BULK_WRITE_MAX_INTERVAL_SECONDS or None, on_idle=self._flush_if_due, on_exit=self._finish_writes,
+        )
+        self.parse_stage = Stage("parse", self._parse, self.parse_workers, self.queue_size, downstream=self.write_stage)
+        self.fetch_stage = Stage("fetch", self._fetch, self.concurrency, self.concurrency * 2, downstream=self.parse_stage)
+
+        done = threading.Event()
+        threading.Thread(target=self._report_forever, args=(done,), name="fetch-stage-report", daemon=True).start()
+        for stage in (self.write_stage, self.parse_stage, self.fetch_stage):
+            stage.start()
+        try:
+            for job in jobs:
+                self.fetch_stage.put(job)
+        finally:
+            self.fetch_stage.close()
+            done.set()
+
+        self.stats["seconds"] = round(time.monotonic() - started, 1)
+        self.stats["stages"] = self.stage_stats()
+        logger.info(f"Fetch pipeline finished: {self.stats}")
+        return self.stats
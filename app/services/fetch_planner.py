@@ -0,0 +1,128 @@
+import datetime
+import math
+import threading
+import logging
+from pymongo import UpdateOne
+
+from ..database import fetch_stats_collection
+from ..config import settings
+from .youtube_service import SEARCH_COST, VIDEOS_LIST_COST
+from .key_pool import PACIFIC
+from .scoring import decayed_score
+
+logger = logging.getLogger("uvicorn")
+
+# Weight of the latest run in the moving averages of a combination's yield
+EWMA_ALPHA = 0.3
+# Added to the new-video average so barren combinations sink to the end instead of never running again
+EXPLORATION_FLOOR = 0.1
+
+
+class FetchPlanner:
+    """
+    Decides which (niche, state, language) queries a sweep runs within the remaining daily quota.
+
+    Per combination, `fetch_stats` keeps moving averages of how many new video_ids a fetch
+    returned and how viral they were (viral score decayed to the fetch time, a log10 scale),
+    plus when it was last fetched. Queries are ranked by expected value per quota unit:
+
+        (new videos + floor) x (1 + avg decayed score) x staleness / cost
+
+    Staleness grows from 0 to 1 over FETCH_PLANNER_REFRESH_HOURS since the last fetch. Combinations
+    with no history get an optimistic prior so they are explored at least once.
+
+    `sweep_budget` paces the remaining quota over the sweeps left before the Pacific quota reset,
+    so one sweep cannot spend the whole day's quota.
+    """
+    def __init__(self, cost_per_query=SEARCH_COST + VIDEOS_LIST_COST):
+        self.cost_per_query = cost_per_query
+        self._stats = {}
+        self._updates = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        self._stats = {
+            (doc["niche"], doc["state"], doc["language"]): doc
+            for doc in fetch_stats_collection.find({}, {"_id": 0})
+        }
+        return self
+
+    def expected_value(self, stat, now):
+        hours = (now - stat["last_fetched_at"]).total_seconds() / 3600 if stat.get("last_fetched_at") else None
+        staleness = 1.0 if hours is None else min(1.0, hours / settings.FETCH_PLANNER_REFRESH_HOURS)
+        quality = 1 + max(stat.get("score_avg", 0), 0)
+        return (stat.get("new_avg", 0) + EXPLORATION_FLOOR) * quality * staleness / self.cost_per_query
+
+    def sweep_budget(self, remaining, now=None):
+        """
+        The quota units one sweep may spend: `remaining` minus the STATS_REFRESH_QUOTA_SHARE kept
+        for stats refreshes, divided by the sweeps that still run before Pacific midnight.
+        """
+        now = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(PACIFIC)
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=PACIFIC)
+        sweeps_left = max(1, math.ceil((midnight - now).total_seconds() / 60 / settings.FETCH_INTERVAL_MINUTES))
+        share = min(max(settings.STATS_REFRESH_QUOTA_SHARE, 0.0), 1.0)
+        return int(remaining * (1 - share) / sweeps_left)
+
+    def plan(self, jobs, budget):
+        """Returns the jobs worth running, best value per quota unit first, that fit in `budget` units."""
+        now = datetime.datetime.utcnow()
+        known = [self.expected_value(stat, now) for stat in self._stats.values()]
+        # Unseen combinations rank level with the best known one until they have been tried
+        prior = (max(known) if known else 1.0) or 1.0
+
+        def value(job):
+            stat = self._stats.get(job[1:])
+            return prior if stat is None else self.expected_value(stat, now)
+
+        ranked = sorted(jobs, key=value, reverse=True)
+        affordable = max(0, int(budget // self.cost_per_query))
+        planned = ranked[:affordable]
+        logger.info(f"🗺️ Planned {len(planned)} of {len(jobs)} queries within {budget} quota units.")
+        return planned
+
+    def published_after(self, job):
+        """
+        Watermark for a query: search only for videos newer than its last successful fetch, minus an
+        overlap for YouTube's indexing delay, but never further back than the 7-day search window.
+        Returns None for queries that have never been fetched.
+        """
+        stat = self._stats.get(job[1:])
+        if not stat or not stat.get("watermark"):
+            return None
+        window_start = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+        return max(stat["watermark"] - datetime.timedelta(minutes=settings.FETCH_WATERMARK_OVERLAP_MINUTES), window_start)
+
+    def record(self, job, new_count, scores, fetched_at=None):
+        """
+        Records the yield of one successful fetch and moves its watermark to `fetched_at`,
+        the moment the search was sent. Thread-safe; persisted by flush().
+        """
+        _, niche, state, language = job
+        key = (niche, state, language)
+        score_avg = decayed_score(sum(scores) / len(scores), fetched_at) if scores else 0.0
+        with self._lock:
+            prev = self._updates.get(key) or self._stats.get(key) or {}
+            runs = prev.get("runs", 0)
+            blend = lambda old, new: new if runs == 0 else (1 - EWMA_ALPHA) * old + EWMA_ALPHA * new
+            self._updates[key] = {
+                "niche": niche, "state": state, "language": language,
+                "runs": runs + 1,
+                "new_avg": blend(prev.get("new_avg", 0.0), new_count),
+                "score_avg": blend(prev.get("score_avg", 0.0), score_avg),
+                "last_new": new_count,
+                "last_fetched_at": datetime.datetime.utcnow(),
+                "watermark": fetched_at or datetime.datetime.utcnow(),
+            }
+
+    def flush(self):
+        """Writes every recorded yield to fetch_stats with one bulk_write."""
+        with self._lock:
+            updates, self._updates = self._updates, {}
+        if not updates:
+            return
+        fetch_stats_collection.bulk_write([
+            UpdateOne({"niche": k[0], "state": k[1], "language": k[2]}, {"$set": doc}, upsert=True)
+            for k, doc in updates.items()
+        ], ordered=False)
+        self._stats.update(updates)
@@ -0,0 +1,71 @@
+import datetime
+import os
+import socket
+import threading
+import uuid
+import logging
+from pymongo.errors import DuplicateKeyError
+
+from ..database import job_locks_collection
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+
+class JobLock:
+    """
+    Lease on a `job_locks` document, so a job runs in one process at a time across every web
+    worker and worker process.
+
+    The lease is taken by upserting {_id: name} only where no unexpired lease exists, and is
+    renewed from a heartbeat thread while the job runs. A holder that crashes stops renewing,
+    and its lease expires after `ttl` seconds, so the next run can take it over.
+    """
+    def __init__(self, name, ttl=None):
+        self.name = name
+        self.ttl = ttl or settings.JOB_LOCK_TTL_SECONDS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _lease(self, now):
+        return {"owner": self.owner, "expires_at": now + datetime.timedelta(seconds=self.ttl), "renewed_at": now}
+
+    def acquire(self):
+        """Takes the lease if it is free or expired. Returns True on success."""
+        now = datetime.datetime.utcnow()
+        try:
+            job_locks_collection.update_one(
+                {"_id": self.name, "expires_at": {"$lt": now}},
+                {"$set": dict(self._lease(now), acquired_at=now)},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # An unexpired lease exists
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_forever, name=f"lock-{self.name}", daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def _renew_forever(self):
+        while not self._stop.wait(self.ttl / 3):
+            result = job_locks_collection.update_one(
+                {"_id": self.name, "owner": self.owner}, {"$set": self._lease(datetime.datetime.utcnow())}
+            )
+            if result.matched_count == 0:
+                logger.warning(f"⚠️ Lost the lease on job lock '{self.name}'.")
+                return
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+            self._heartbeat = None
+        job_locks_collection.delete_one({"_id": self.name, "owner": self.owner})
+
+
+def is_locked(name):
+    """True while an unexpired lease on `name` exists."""
+    return job_locks_collection.count_documents(
+        {"_id": name, "expires_at": {"$gte": datetime.datetime.utcnow()}}, limit=1
+    ) > 0
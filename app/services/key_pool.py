@@ -0,0 +1,206 @@
+import datetime
+import threading
+import time
+import atexit
+import logging
+from zoneinfo import ZoneInfo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ..database import api_key_usage_collection
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+# YouTube Data API quotas reset at midnight Pacific time
+PACIFIC = ZoneInfo("America/Los_Angeles")
+
+
+def quota_day(now=None):
+    """The current quota day as an ISO date string in Pacific time."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now.astimezone(PACIFIC).date().isoformat()
+
+
+class KeyPool:
+    """
+    Keeps the daily quota usage of every API key in memory and hands out keys by remaining budget.
+
+    Usage is loaded from `api_key_usage`, and what this process spends since is written back
+    as $inc deltas in one bulk_write per flush interval instead of one update per API call.
+    The worker and web processes each keep a pool, so neither overwrites the other's usage;
+    `refresh()` (called when a job starts) re-reads what the others have spent.
+    Safe to share between fetch threads.
+    """
+    def __init__(self, api_keys, daily_limit=None, flush_interval=None):
+        self.api_keys = list(api_keys)
+        self.daily_limit = daily_limit or settings.YOUTUBE_DAILY_QUOTA
+        self.flush_interval = flush_interval or settings.KEY_POOL_FLUSH_SECONDS
+        self._lock = threading.Lock()
+        self._day = quota_day()
+        self._used = {key: 0 for key in self.api_keys}
+        self._active = {key: True for key in self.api_keys}
+        self._last_used = {}
+        self._pending = {}  # key -> units spent (or released) since the last flush
+        self._exhausted = set()  # keys to store as fully used on the next flush
+        self._dirty = set()
+        self._load()
+
+    def _load(self):
+        if not self.api_keys:
+            logger.warning("⚠️ NO API KEYS FOUND! Please check your .env file.")
+            return
+        known = set()
+        usages = list(api_key_usage_collection.find({"api_key": {"$in": self.api_keys}}))
+        with self._lock:
+            self._roll_day()
+            for usage in usages:
+                key = usage["api_key"]
+                known.add(key)
+                self._active[key] = usage.get("is_active", True)
+                stored = usage.get("daily_quota_used", 0) if usage.get("quota_day") == self._day else 0
+                if usage.get("quota_day") != self._day:
+                    self._dirty.add(key)  # New quota day: persist the reset on the next flush
+                self._used[key] = stored + self._pending.get(key, 0)
+        missing = [key for key in self.api_keys if key not in known]
+        if missing:
+            api_key_usage_collection.bulk_write([
+                UpdateOne({"api_key": key}, {"$setOnInsert": {
+                    "api_key": key, "daily_quota_used": 0, "quota_day": self._day,
+                    "is_active": True, "last_used": datetime.datetime.utcnow()
+                }}, upsert=True)
+                for key in missing
+            ], ordered=False)
+        logger.info(f"✅ Loaded quota state for {len(self.api_keys)} API keys ({self.remaining()} units left today).")
+
+    def _roll_day(self):
+        """Resets every key when the Pacific quota day changes. Must be called with the lock held."""
+        today = quota_day()
+        if today != self._day:
+            self._day = today
+            self._used = {key: 0 for key in self.api_keys}
+            self._pending = {}  # Unflushed spend of the old day does not count against the new one
+            self._exhausted = set()
+            self._dirty.update(self.api_keys)
+
+    def _spend(self, key, units):
+        """Adds `units` (negative to give back) to a key's usage. Must be called with the lock held."""
+        self._used[key] += units
+        self._pending[key] = self._pending.get(key, 0) + units
+
+    def acquire(self, cost):
+        """Reserves `cost` units on the active key with the most budget left. Returns the key or None."""
+        with self._lock:
+            self._roll_day()
+            best = None
+            for key in self.api_keys:
+                if not self._active[key]:
+                    continue
+                left = self.daily_limit - self._used[key]
+                if left >= cost and (best is None or left > self.daily_limit - self._used[best]):
+                    best = key
+            if best is not None:
+                self._spend(best, cost)
+                self._last_used[best] = datetime.datetime.utcnow()
+                self._dirty.add(best)
+            return best
+
+    def release(self, key, cost):
+        """Returns units reserved by `acquire` that were not spent."""
+        with self._lock:
+            self._spend(key, -min(cost, self._used[key]))
+
+    def exhaust(self, key):
+        """Marks a key as out of quota for the rest of the day, e.g. after a 403 from the API."""
+        with self._lock:
+            # Stored as $max, not as a delta: this process only knows its own share of the usage
+            self._used[key] = max(self._used[key], self.daily_limit)
+            self._exhausted.add(key)
+
+    def remaining(self):
+        """Total units left today across all active keys."""
+        with self._lock:
+            self._roll_day()
+            return sum(max(0, self.daily_limit - self._used[key]) for key in self.api_keys if self._active[key])
+
+    def flush(self):
+        """
+        Persists what this process spent on each key since the last flush, as $inc deltas.
+        Keys whose stored usage is from an older quota day are reset to zero first.
+        """
+        with self._lock:
+            self._roll_day()
+            day = self._day
+            pending, self._pending = self._pending, {}
+            dirty, self._dirty = self._dirty, set()
+            exhausted, self._exhausted = self._exhausted, set()
+            last_used = dict(self._last_used)
+        keys = dirty | set(pending) | exhausted
+        if not keys:
+            return
+        now = datetime.datetime.utcnow()
+        resets = [
+            UpdateOne({"api_key": key, "quota_day": {"$ne": day}}, {"$set": {"quota_day": day, "daily_quota_used": 0}})
+            for key in keys
+        ]
+        updates = [
+            ("inc", key, UpdateOne({"api_key": key, "quota_day": day}, {
+                "$inc": {"daily_quota_used": pending.get(key, 0)},
+                "$set": {"last_used": last_used.get(key, now)},
+            }))
+            for key in keys
+        ] + [
+            ("max", key, UpdateOne({"api_key": key, "quota_day": day}, {"$max": {"daily_quota_used": self.daily_limit}}))
+            for key in exhausted
+        ]
+        resets_written = False
+        try:
+            # Resets are idempotent and must land before the updates, so they go first on their own
+            api_key_usage_collection.bulk_write(resets, ordered=False)
+            resets_written = True
+            api_key_usage_collection.bulk_write([op for _, _, op in updates], ordered=False)
+            failed = []
+        except BulkWriteError as e:
+            failed = [updates[error["index"]] for error in e.details.get("writeErrors", [])] if resets_written else updates
+            logger.error(f"Failed to persist API key usage for {len(failed)} updates: {e}")
+        except Exception as e:
+            failed = updates
+            logger.error(f"Failed to persist API key usage: {e}")
+        if failed:
+            # Put what was not written back for the next flush, unless the quota day moved on meanwhile
+            with self._lock:
+                if self._day == day:
+                    for kind, key, _ in failed:
+                        if kind == "max":
+                            self._exhausted.add(key)
+                        else:
+                            self._dirty.add(key)
+                            if pending.get(key):
+                                self._pending[key] = self._pending.get(key, 0) + pending[key]
+
+    def refresh(self):
+        """Flushes this process's usage, then re-reads every key so spending by other processes counts."""
+        self.flush()
+        self._load()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool():
+    """Returns the process-wide KeyPool, loading it from the database on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = KeyPool([key.strip() for key in settings.YOUTUBE_API_KEYS if key.strip()])
+                threading.Thread(target=pool._flush_forever, name="key-pool-flush", daemon=True).start()
+                atexit.register(pool.flush)
+                _pool = pool
+    return _pool
@@ -0,0 +1,121 @@
+import math
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+from ..database import async_user_activity_collection, async_user_follows_collection, async_videos_collection
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+# How much each kind of activity says about a user's interest in a video's niche
+VIEW_WEIGHT = 1.0
+REPLAY_WEIGHT = 2.0
+LIKE_WEIGHT = 3.0
+WATCH_SECONDS_WEIGHT = 1 / 30
+
+
+class UserAffinity:
+    """
+    What personalized ranking needs to know about one user: the videos they have already
+    watched, the channels they follow, and their interest per niche scaled to 0..1.
+    """
+    __slots__ = ("watched", "followed", "niches")
+
+    def __init__(self, watched, followed, niches):
+        self.watched = watched
+        self.followed = followed
+        self.niches = niches
+
+    def boost(self, channel_id, niche):
+        """Multiplier on weighted views for a candidate, >= 1."""
+        boost = 1.0
+        if channel_id in self.followed:
+            boost += settings.PERSONAL_FOLLOW_BOOST
+        return boost + settings.PERSONAL_NICHE_BOOST * self.niches.get(niche, 0.0)
+
+
+async def load_affinity(uid):
+    """Builds a UserAffinity from the user's recent activity, their follows and the niches of what they watched."""
+    activity = await async_user_activity_collection.find(
+        {"uid": uid}, {"_id": 0, "video_id": 1, "view_count": 1, "replay_count": 1, "liked": 1, "watch_seconds": 1}
+    ).sort("last_event_at", -1).limit(settings.PERSONAL_ACTIVITY_DEPTH).to_list()
+    followed = {f["channel_id"] async for f in async_user_follows_collection.find({"uid": uid}, {"_id": 0, "channel_id": 1})}
+
+    interest = {}
+    for a in activity:
+        interest[a["video_id"]] = (
+            VIEW_WEIGHT * a.get("view_count", 0)
+            + REPLAY_WEIGHT * a.get("replay_count", 0)
+            + LIKE_WEIGHT * bool(a.get("liked"))
+            + WATCH_SECONDS_WEIGHT * a.get("watch_seconds", 0)
+        )
+    niches = {}
+    if interest:
+        async for video in async_videos_collection.find({"video_id": {"$in": list(interest)}}, {"_id": 0, "video_id": 1, "niche": 1}):
+            if video.get("niche"):
+                niches[video["niche"]] = niches.get(video["niche"], 0.0) + interest[video["video_id"]]
+    top = max(niches.values(), default=0.0)
+    if top > 0:
+        niches = {niche: value / top for niche, value in niches.items()}
+    return UserAffinity(set(interest), followed, niches)
+
+
+class AffinityCache:
+    """
+    Per-process LRU of UserAffinity, kept for `ttl` seconds, so a personalized page costs one
+    load per user per TTL. Videos reported through the activity endpoint are added to the
+    cached watched set right away.
+    """
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or settings.PERSONAL_CACHE_SIZE
+        self.ttl = ttl or settings.PERSONAL_CACHE_TTL_SECONDS
+        self._entries = OrderedDict()  # uid -> (expires_at, UserAffinity)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    async def get(self, uid):
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(uid)
+                self._stats["hits"] += 1
+                return entry[1]
+            self._stats["misses"] += 1
+        affinity = await load_affinity(uid)
+        with self._lock:
+            self._entries[uid] = (time.time() + self.ttl, affinity)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return affinity
+
+    def note_watched(self, uid, video_ids):
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None:
+                entry[1].watched.update(video_ids)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), maxsize=self.maxsize)
+
+
+affinity_cache = AffinityCache()
+
+
+def rerank(candidates, affinity):
+    """
+    Drops watched candidates and orders the rest by viral score plus log10 of the user's boost.
+    Scores are log10 of weighted views, so this multiplies weighted views by the boost.
+    `candidates` are [video_id, score, channel_id, niche]; returns [(personal score, video_id)] best first.
+    """
+    watched = affinity.watched
+    ranked = [
+        (score + math.log10(affinity.boost(channel_id, niche)), video_id)
+        for video_id, score, channel_id, niche in candidates
+        if video_id not in watched
+    ]
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return ranked
@@ -0,0 +1,197 @@
+import datetime
+import logging
+import math
+import numpy as np
+from pymongo import UpdateOne
+
+from ..constants import STATES, LANGUAGES, STATE_LANGUAGE_MAP
+from .bulk_writer import BulkWriter
+
+logger = logging.getLogger("uvicorn")
+
+# Fields read from the videos collection to score a video
+SCORING_FIELDS = ["video_id", "published_at", "view_count", "like_count", "comment_count", "is_short", "state", "language", "viral_score"]
+
+
+# Reference point of the time term in stored scores. Any fixed instant works; moving it shifts every score equally.
+SCORE_EPOCH = datetime.datetime(2025, 1, 1)
+
+
+class ScoreWeights:
+    """
+    Tunable factors of the viral score. The stored score is a time-independent "hot" score:
+
+        log10(views x (1 + engagement x (likes + comment_weight x comments) / views)
+              x short_boost (shorts) x regional_boost (video in its state's language))
+        + hours from SCORE_EPOCH to published_at / decay_hours
+
+    A video `decay_hours` older needs ten times the weighted views to rank level. Decay against
+    the current time is the same offset for every video, so it is applied at query time
+    (decayed_score) and never changes the order of stored scores or the viral_score index.
+    """
+    def __init__(self, engagement=10.0, comment_weight=2.0, short_boost=1.5, regional_boost=1.2, decay_hours=24.0):
+        self.engagement = engagement
+        self.comment_weight = comment_weight
+        self.short_boost = short_boost
+        self.regional_boost = regional_boost
+        self.decay_hours = decay_hours
+
+
+DEFAULT_WEIGHTS = ScoreWeights()
+
+
+def _hours_since_epoch(moment):
+    return (moment - SCORE_EPOCH).total_seconds() / 3600
+
+
+def score_video(video, weights=DEFAULT_WEIGHTS):
+    """Stored score of one video document. Same formula as ScoreColumns.scores, for the ingest path."""
+    views = video.get("view_count", 0)
+    engagement_ratio = 0
+    if views > 0:
+        engagement_ratio = (video.get("like_count", 0) + video.get("comment_count", 0) * weights.comment_weight) / views
+    weighted_views = views * (1 + engagement_ratio * weights.engagement)
+    if video.get("is_short", False):
+        weighted_views *= weights.short_boost
+    if video.get("state") in STATE_LANGUAGE_MAP and video.get("language") == STATE_LANGUAGE_MAP[video["state"]]:
+        weighted_views *= weights.regional_boost
+    return math.log10(max(weighted_views, 1)) + _hours_since_epoch(video["published_at"]) / weights.decay_hours
+
+
+def decayed_score(score, now=None, weights=DEFAULT_WEIGHTS):
+    """
+    Stored score(s) decayed to `now`: log10 of weighted views, less one per `decay_hours` of age.
+    Works on a float or a NumPy array; ranking by it gives the same order as ranking by the stored score.
+    """
+    return score - _hours_since_epoch(now or datetime.datetime.utcnow()) / weights.decay_hours
+
+
+def _encoder(known):
+    """Returns (names, encode): encode maps a value to a small integer code, 0 for missing, growing names for unseen values."""
+    names = [None] + list(known)
+    codes = {name: code for code, name in enumerate(names) if name is not None}
+
+    def encode(value):
+        if value is None:
+            return 0
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+    return names, encode
+
+
+class ScoreColumns:
+    """
+    The scoring fields of many videos as parallel NumPy arrays, so the whole corpus is scored in
+    one vectorized pass instead of one Python call per video.
+    """
+    def __init__(self, video_ids, published_at, views, likes, comments, is_short, state, language, stored, state_names, language_names):
+        self.video_ids = video_ids
+        self.published_at = published_at  # datetime64[ms], naive UTC like the stored dates
+        self.views = views
+        self.likes = likes
+        self.comments = comments
+        self.is_short = is_short
+        self.state = state
+        self.language = language
+        self.stored = stored  # viral_score currently in the database, NaN if missing
+        self.state_names = state_names  # state[i] and language[i] index these lists; 0 is None
+        self.language_names = language_names
+        language_codes = {name: code for code, name in enumerate(language_names) if name is not None}
+        # Regional language code per state code, -1 where a state has none so it never matches
+        self._regional_language = np.array(
+            [-1] + [language_codes.get(STATE_LANGUAGE_MAP.get(name), -1) for name in state_names[1:]], dtype=np.int32
+        )
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    @classmethod
+    def from_documents(cls, docs):
+        """Builds the columns from an iterable of video documents. Documents without published_at are skipped."""
+        video_ids, published_at, views, likes, comments, is_short, state, language, stored = ([] for _ in range(9))
+        state_names, encode_state = _encoder(STATES)
+        language_names, encode_language = _encoder(LANGUAGES)
+        for doc in docs:
+            if doc.get("published_at") is None:
+                continue
+            video_ids.append(doc["video_id"])
+            published_at.append(doc["published_at"])
+            views.append(doc.get("view_count", 0))
+            likes.append(doc.get("like_count", 0))
+            comments.append(doc.get("comment_count", 0))
+            is_short.append(bool(doc.get("is_short", False)))
+            state.append(encode_state(doc.get("state") or None))
+            language.append(encode_language(doc.get("language") or None))
+            score = doc.get("viral_score")
+            stored.append(np.nan if score is None else score)
+        return cls(
+            video_ids,
+            np.array(published_at, dtype="datetime64[ms]"),
+            np.array(views, dtype=np.float64),
+            np.array(likes, dtype=np.float64),
+            np.array(comments, dtype=np.float64),
+            np.array(is_short, dtype=bool),
+            np.array(state, dtype=np.int32),
+            np.array(language, dtype=np.int32),
+            np.array(stored, dtype=np.float64),
+            state_names,
+            language_names,
+        )
+
+    @classmethod
+    def load(cls, collection, query=None):
+        """Reads the scoring fields of every matching video with one projected scan."""
+        projection = {"_id": 0, **{field: 1 for field in SCORING_FIELDS}}
+        return cls.from_documents(collection.find(query or {}, projection, batch_size=10000))
+
+    def scores(self, weights=DEFAULT_WEIGHTS):
+        """Vectorized score_video over every row. Returns a float64 array."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            engagement_ratio = np.where(
+                self.views > 0, (self.likes + self.comments * weights.comment_weight) / self.views, 0.0
+            )
+        weighted_views = self.views * (1 + engagement_ratio * weights.engagement)
+        weighted_views *= np.where(self.is_short, weights.short_boost, 1.0)
+        regional = (self.state > 0) & (self.language == self._regional_language[self.state])
+        weighted_views *= np.where(regional, weights.regional_boost, 1.0)
+        hours = (self.published_at - np.datetime64(SCORE_EPOCH, "ms")) / np.timedelta64(1, "h")
+        return np.log10(np.maximum(weighted_views, 1)) + hours / weights.decay_hours
+
+    def records(self, scores):
+        """Yields ranking documents (video_id, viral_score, state, language, is_short) for ViralEngine.compute_tiers."""
+        states, languages = self.state_names, self.language_names
+        for i, video_id in enumerate(self.video_ids):
+            yield {
+                "video_id": video_id,
+                "viral_score": float(scores[i]),
+                "state": states[self.state[i]],
+                "language": languages[self.language[i]],
+                "is_short": bool(self.is_short[i]),
+            }
+
+
+def write_scores(collection, columns, scores, writer=None, tolerance=1e-9):
+    """
+    Writes back every score that differs from the stored one, as unordered bulk updates.
+    Stored scores do not change with time, so only videos with new counts or new weights are written.
+    Returns the number of documents modified.
+    """
+    writer = writer or BulkWriter()
+    changed = ~np.isclose(scores, columns.stored, rtol=0.0, atol=tolerance)
+    for i in np.flatnonzero(changed):
+        video_id = columns.video_ids[i]
+        writer.add(collection, UpdateOne({"video_id": video_id}, {"$set": {"viral_score": float(scores[i])}}), key=video_id)
+    writer.flush()
+    return writer.totals["modified"]
+
+
+def rescore_all(collection, weights=DEFAULT_WEIGHTS):
+    """Loads, scores and writes back the whole collection. Returns (columns, scores)."""
+    columns = ScoreColumns.load(collection)
+    scores = columns.scores(weights)
+    modified = write_scores(collection, columns, scores)
+    logger.info(f"🧮 Rescored {len(columns)} videos, {modified} scores changed.")
+    return columns, scores
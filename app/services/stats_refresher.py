@@ -0,0 +1,78 @@
+import datetime
+import logging
+from pymongo import UpdateOne
+
+from ..database import videos_collection, viral_index_collection
+from ..config import settings
+from .bulk_writer import BulkWriter
+
+logger = logging.getLogger("uvicorn")
+
+# videos.list accepts at most 50 ids per call
+STATS_BATCH_SIZE = 50
+
+# Fields needed to recompute viral_score after the counts change
+SCORING_PROJECTION = {
+    "_id": 0, "video_id": 1, "published_at": 1, "view_count": 1, "like_count": 1,
+    "comment_count": 1, "is_short": 1, "state": 1, "language": 1
+}
+
+
+class StatsRefresher:
+    """
+    Refreshes view/like/comment counts of the videos that matter for ranking and rescores them.
+
+    Candidates are every video currently in viral_index plus the best recent videos. Each
+    videos.list call covers 50 ids for 1 quota unit, so a refresh costs about
+    candidates / 50 units and never depends on the size of the whole collection.
+    """
+    def __init__(self, yt_service):
+        self.yt_service = yt_service
+
+    def candidates(self):
+        """Returns the scoring fields of every candidate video, keyed by video_id."""
+        ranked_ids = set(viral_index_collection.distinct("video_id"))
+        since = datetime.datetime.utcnow() - datetime.timedelta(hours=settings.STATS_REFRESH_RECENT_HOURS)
+        recent = videos_collection.find(
+            {"published_at": {"$gte": since}}, SCORING_PROJECTION
+        ).sort("viral_score", -1).limit(settings.STATS_REFRESH_MAX_RECENT)
+
+        videos = {v["video_id"]: v for v in recent}
+        missing = [video_id for video_id in ranked_ids if video_id not in videos]
+        if missing:
+            videos.update((v["video_id"], v) for v in videos_collection.find({"video_id": {"$in": missing}}, SCORING_PROJECTION))
+        return videos
+
+    def refresh(self):
+        """Runs one refresh pass. Returns counts of candidates, API calls, updated videos and errors."""
+        videos = self.candidates()
+        video_ids = list(videos)
+        writer = BulkWriter()
+        calls = failed_calls = 0
+        now = datetime.datetime.utcnow()
+
+        for start in range(0, len(video_ids), STATS_BATCH_SIZE):
+            statistics = self.yt_service.fetch_statistics(video_ids[start:start + STATS_BATCH_SIZE])
+            if statistics is None:
+                logger.warning("⚠️ Stats refresh stopped early: videos.list failed or quota is exhausted.")
+                failed_calls += 1
+                break
+            calls += 1
+            for video_id, stats in statistics.items():
+                video = videos[video_id]
+                video["view_count"] = int(stats.get("viewCount", 0))
+                video["like_count"] = int(stats.get("likeCount", 0))
+                video["comment_count"] = int(stats.get("commentCount", 0))
+                writer.add(videos_collection, UpdateOne({"video_id": video_id}, {"$set": {
+                    "view_count": video["view_count"],
+                    "like_count": video["like_count"],
+                    "comment_count": video["comment_count"],
+                    "viral_score": self.yt_service.calculate_viral_score(video),
+                    "stats_refreshed_at": now,
+                }}), key=video_id)
+            writer.flush_if_due()
+
+        writer.flush()
+        result = {"candidates": len(video_ids), "api_calls": calls, "updated": writer.totals["modified"], "errors": writer.totals["failed"] + failed_calls}
+        logger.info(f"📈 Stats refresh finished: {result}")
+        return result
@@ -1,65 +1,128 @@
-from ..database import videos_collection, viral_index_collection
-import pymongo
+from ..database import videos_collection, viral_index_collection, create_viral_index_indexes
+from ..config import settings
+from .feed_cache import feed_cache
+from .candidate_store import candidate_store
+from .scoring import DEFAULT_WEIGHTS, rescore_all
+import datetime
+import heapq
+import logging
+
+logger = logging.getLogger("uvicorn")
+
+# Only the fields needed to rank a video are read from the videos collection
+RANKING_PROJECTION = {"_id": 0, "video_id": 1, "viral_score": 1, "state": 1, "language": 1, "is_short": 1}
 
 class ViralEngine:
-    def __init__(self):
-        pass
+    def __init__(self, videos=None, viral_index=None, weights=None):
+        self.videos = videos if videos is not None else videos_collection
+        self.viral_index = viral_index if viral_index is not None else viral_index_collection
+        self.weights = weights or DEFAULT_WEIGHTS
+        self._entries = []
 
-    def update_viral_indices(self):
+    def update_viral_indices(self, rescore=None):
         """
         Re-calculates and populates the ViralIndex collection for:
         - GLOBAL
         - STATE
         - LANGUAGE
         - STATE_LANGUAGE
+
+        With `rescore` (default RESCORE_ON_REBUILD) every video is first rescored in one vectorized
+        pass, changed scores are written back, and the tiers are ranked from the fresh scores.
+        Stored scores already include time decay relative to a fixed epoch, so ranking by them
+        is ranking by current hotness.
+
+        The new index is bulk-inserted into a staging collection and then renamed over
+        `viral_index` in one step, so readers always see a complete ranking.
+        """
+        self._entries = []
+        self.last_updated = datetime.datetime.utcnow()
+
+        videos = None
+        if rescore if rescore is not None else settings.RESCORE_ON_REBUILD:
+            columns, scores = rescore_all(self.videos, self.weights)
+            videos = columns.records(scores)
+
+        for (v_type, state, language, shorts), ranked in self.compute_tiers(videos).items():
+            for rank, (score, video_id, is_short) in enumerate(ranked, 1):
+                self._add_index(video_id, score, v_type, rank, state=state, language=language, is_short=is_short, shorts=shorts)
+
+        self._swap_in(self._entries)
+
+    def compute_tiers(self, videos=None):
         """
-        # Clear old indices
-        viral_index_collection.delete_many({})
-        
-        # 1. GLOBAL VIRAL
-        global_videos = videos_collection.find().sort("viral_score", pymongo.DESCENDING).limit(100)
-        for rank, vid in enumerate(global_videos, 1):
-            self._add_index(vid, "GLOBAL", rank)
-
-        # 2. STATE VIRAL
-        states = videos_collection.distinct("state")
-        for state in states:
-            if not state: continue
-            videos = videos_collection.find({"state": state}).sort("viral_score", pymongo.DESCENDING).limit(50)
-            for rank, vid in enumerate(videos, 1):
-                self._add_index(vid, "STATE", rank, state=state)
-
-        # 3. LANGUAGE VIRAL
-        languages = videos_collection.distinct("language")
-        for lang in languages:
-            if not lang: continue
-            videos = videos_collection.find({"language": lang}).sort("viral_score", pymongo.DESCENDING).limit(50)
-            for rank, vid in enumerate(videos, 1):
-                self._add_index(vid, "LANGUAGE", rank, language=lang)
-                
-        # 4. STATE_LANGUAGE VIRAL
-        # Get unique combinations via aggregation
-        pipeline = [
-            {"$group": {"_id": {"state": "$state", "language": "$language"}}}
-        ]
-        combos = videos_collection.aggregate(pipeline)
-        
-        for combo in combos:
-            state = combo["_id"].get("state")
-            lang = combo["_id"].get("language")
-            if not state or not lang: continue
-            
-            videos = videos_collection.find({"state": state, "language": lang}).sort("viral_score", pymongo.DESCENDING).limit(50)
-            for rank, vid in enumerate(videos, 1):
-                self._add_index(vid, "STATE_LANGUAGE", rank, state=state, language=lang)
-
-    def _add_index(self, video, v_type, rank, state=None, language=None):
-        idx = {
-            "video_id": video["video_id"],
+        Ranks every tier in a single projected scan of the videos collection, or of `videos`
+        (ranking documents, e.g. from ScoreColumns.records) when given.
+
+        Each tier keeps a bounded min-heap of (viral_score, video_id, is_short), so the cost is one
+        collection scan plus O(log depth) per video and tier, however many partitions exist.
+        Every tier is ranked three times: over all videos (shorts=None), over shorts only (True)
+        and over the rest (False), so an is_short feed gets the full depth of its own kind.
+        Returns {(viral_type, state, language, shorts): [(score, video_id, is_short), ...]} sorted best first.
+        """
+        global_depth = settings.VIRAL_GLOBAL_DEPTH
+        tier_depth = settings.VIRAL_TIER_DEPTH
+        heaps = {}
+
+        def offer(key, depth, item):
+            for heap_key in (key + (None,), key + (item[2],)):
+                heap = heaps.get(heap_key)
+                if heap is None:
+                    heap = heaps[heap_key] = []
+                if len(heap) < depth:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+        if videos is None:
+            videos = self.videos.find({}, RANKING_PROJECTION, batch_size=10000)
+        for video in videos:
+            score = video.get("viral_score")
+            if score is None:
+                continue
+            item = (score, video["video_id"], bool(video.get("is_short", False)))
+            state = video.get("state")
+            language = video.get("language")
+
+            offer(("GLOBAL", None, None), global_depth, item)
+            if state:
+                offer(("STATE", state, None), tier_depth, item)
+            if language:
+                offer(("LANGUAGE", None, language), tier_depth, item)
+            if state and language:
+                offer(("STATE_LANGUAGE", state, language), tier_depth, item)
+
+        return {key: sorted(heap, reverse=True) for key, heap in heaps.items()}
+
+    def _add_index(self, video_id, score, v_type, rank, state=None, language=None, is_short=False, shorts=None):
+        """`is_short` is the video's own flag; `shorts` says which ranking of the tier the entry belongs to."""
+        self._entries.append({
+            "video_id": video_id,
             "viral_type": v_type,
-            "score": video["viral_score"],
+            "score": score,
             "rank": rank,
             "state": state,
-            "language": language
-        }
-        viral_index_collection.insert_one(idx)
+            "language": language,
+            "is_short": is_short,
+            "shorts": shorts,
+            "last_updated": self.last_updated
+        })
+
+    def _swap_in(self, entries):
+        """Builds the new index in a staging collection and atomically replaces viral_index with it."""
+        if not entries:
+            logger.warning("⚠️ Viral index rebuild produced no entries. Keeping the current index.")
+            return
+        staging = self.viral_index.database[f"{self.viral_index.name}_staging_{self.last_updated.strftime('%Y%m%d%H%M%S%f')}"]
+        try:
+            staging.insert_many(entries, ordered=False)
+            create_viral_index_indexes(staging)
+            staging.rename(self.viral_index.name, dropTarget=True)
+        except Exception:
+            staging.drop()
+            raise
+        generation = feed_cache.bump_generation()
+        logger.info(f"✅ Viral index swapped in with {len(entries)} entries (feed cache generation {generation}).")
+        # A web process that rebuilt the index itself reloads its store now instead of at the next check
+        if candidate_store.ready:
+            candidate_store.refresh()
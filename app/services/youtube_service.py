@@ -1,108 +1,176 @@
 import datetime
+import threading
 import requests
-from ..database import api_key_usage_collection, videos_collection, channels_collection
+from pymongo import UpdateOne
+from ..database import videos_collection, channels_collection
 from ..config import settings
 import logging
 import isodate # Library to parse ISO 8601 duration
+from .bulk_writer import BulkWriter
+from .key_pool import get_key_pool
+from .scoring import DEFAULT_WEIGHTS, score_video
 
 logger = logging.getLogger("uvicorn")
 
+# Quota cost of each YouTube Data API call made by fetch_video_items
+SEARCH_COST = 100
+VIDEOS_LIST_COST = 1
+
 class YouTubeService:
-    def __init__(self):
-        self.api_keys = [key.strip() for key in settings.YOUTUBE_API_KEYS if key.strip()]
-        self.current_key_index = 0
-        self._initialize_keys()
-
-    def _initialize_keys(self):
-        if not self.api_keys:
-            logger.warning("⚠️ NO API KEYS FOUND! Please check your .env file.")
-            return
-
-        for key in self.api_keys:
-            exists = api_key_usage_collection.find_one({"api_key": key})
-            if not exists:
-                api_key_usage_collection.insert_one({
-                    "api_key": key,
-                    "daily_quota_used": 0,
-                    "is_active": True,
-                    "last_used": datetime.datetime.utcnow()
-                })
-        logger.info(f"✅ Loaded and verified {len(self.api_keys)} API keys.")
-
-    def get_next_active_key(self):
-        # ... (code is unchanged)
-        if not self.api_keys:
-            return None
-        for _ in range(len(self.api_keys)):
-            key_to_check = self.api_keys[self.current_key_index]
-            self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-            usage = api_key_usage_collection.find_one({"api_key": key_to_check, "is_active": True})
-            if not usage:
-                continue
-            now = datetime.datetime.utcnow()
-            if usage.get("last_used") and usage["last_used"].date() < now.date():
-                usage["daily_quota_used"] = 0
-                api_key_usage_collection.update_one(
-                    {"_id": usage["_id"]},
-                    {"$set": {"daily_quota_used": 0, "last_used": now}}
-                )
-            if usage.get("daily_quota_used", 0) < 9500:
-                return usage
-        return None
+    def __init__(self, rate_limiter=None, key_pool=None, weights=None):
+        self.key_pool = key_pool or get_key_pool()
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.api_keys = self.key_pool.api_keys
+        self.rate_limiter = rate_limiter
+        # Caps the number of in-flight requests made with any single API key
+        self._key_semaphores = {
+            key: threading.BoundedSemaphore(settings.FETCH_PER_KEY_CONCURRENCY) for key in self.api_keys
+        }
+        # API calls sent and quota units spent by this service, reported in job runs
+        self.usage = {"api_calls": 0, "quota_spent": 0}
+        self._usage_lock = threading.Lock()
+
+    def _track(self, name, amount=1):
+        with self._usage_lock:
+            self.usage[name] += amount
 
-    def increment_quota(self, key_obj, cost=1):
-        # ... (code is unchanged)
-        api_key_usage_collection.update_one(
-            {"_id": key_obj["_id"]},
-            {
-                "$inc": {"daily_quota_used": cost},
-                "$set": {"last_used": datetime.datetime.utcnow()}
+    def _acquire(self, cost):
+        api_key = self.key_pool.acquire(cost)
+        if api_key:
+            self._track("quota_spent", cost)
+        return api_key
+
+    def _release(self, api_key, cost):
+        self.key_pool.release(api_key, cost)
+        self._track("quota_spent", -cost)
+
+    def _get(self, url, params):
+        """Performs a GET request, honouring the global rate limit and the per-key concurrency cap."""
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        self._track("api_calls")
+        with self._key_semaphores[params["key"]]:
+            return requests.get(url, params=params, timeout=settings.HTTP_TIMEOUT_SECONDS)
+
+    def fetch_video_items(self, query, niche, state, language, max_results=50, published_after=None, known_ids=None):
+        """
+        Runs the search + videos.list calls for one query and returns the raw video items.
+        Nothing is written to the database here, so callers can hand the items to a separate writer.
+
+        Only videos published after `published_after` (default: the last 7 days) are searched, and
+        ids in `known_ids` are dropped before the videos.list call, so quota is only spent hydrating
+        videos we have not stored yet. Returns None when the fetch failed or could not be made
+        because every key is out of quota, and [] when there was simply nothing new.
+        """
+        search_url = "https://www.googleapis.com/youtube/v3/search"
+        if published_after is None:
+            published_after = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+        # A 403 means the key is out of quota: retry once per key at most, never recursively
+        for _ in range(max(1, len(self.api_keys))):
+            api_key = self._acquire(SEARCH_COST + VIDEOS_LIST_COST)
+            if not api_key:
+                logger.error("❌ All API keys have exhausted their quotas for today.")
+                return None
+            params = {
+                "part": "snippet", "q": f"{query} {niche} {language}", "type": "video",
+                "maxResults": max_results, "order": "date", "regionCode": "IN",
+                "publishedAfter": published_after.replace(microsecond=0).isoformat("T") + "Z",
+                "key": api_key
             }
-        )
+            try:
+                response = self._get(search_url, params)
+                if response.status_code == 403:
+                    self.key_pool.exhaust(api_key)
+                    continue
+                if response.status_code != 200:
+                    self._release(api_key, VIDEOS_LIST_COST)
+                    return None
+                video_ids = [item["id"]["videoId"] for item in response.json().get("items", [])]
+                if known_ids:
+                    video_ids = [video_id for video_id in video_ids if video_id not in known_ids]
+                if not video_ids:
+                    self._release(api_key, VIDEOS_LIST_COST)
+                    return []
+                videos_url = "https://www.googleapis.com/youtube/v3/videos"
+                v_params = {"part": "snippet,contentDetails,statistics", "id": ",".join(video_ids), "key": api_key}
+                v_response = self._get(videos_url, v_params)
+                if v_response.status_code != 200:
+                    return None
+                return v_response.json().get("items", [])
+            except Exception as e:
+                logger.error(f"Exception in fetch_video_items: {e}")
+                return None
+        logger.error(f"❌ Every API key was rejected for '{niche} | {state} | {language}'.")
+        return None
+
+    def fetch_statistics(self, video_ids):
+        """
+        Returns {video_id: statistics} for up to 50 ids with one videos.list call (1 quota unit).
+        Returns None when the call failed or no key has quota left.
+        """
+        videos_url = "https://www.googleapis.com/youtube/v3/videos"
+        for _ in range(max(1, len(self.api_keys))):
+            api_key = self._acquire(VIDEOS_LIST_COST)
+            if not api_key:
+                logger.error("❌ All API keys have exhausted their quotas for today.")
+                return None
+            try:
+                response = self._get(videos_url, {"part": "statistics", "id": ",".join(video_ids), "key": api_key})
+                if response.status_code == 403:
+                    self.key_pool.exhaust(api_key)
+                    continue
+                if response.status_code != 200:
+                    return None
+                return {item["id"]: item.get("statistics", {}) for item in response.json().get("items", [])}
+            except Exception as e:
+                logger.error(f"Exception in fetch_statistics: {e}")
+                return None
+        return None
 
     def fetch_videos(self, query, niche, state, language, max_results=50):
-        # ... (code is unchanged)
-        key_usage = self.get_next_active_key()
-        if not key_usage:
-            logger.error("❌ All API keys have exhausted their quotas for today.")
-            return []
-        api_key = key_usage["api_key"]
-        search_url = "https://www.googleapis.com/youtube/v3/search"
-        params = {
-            "part": "snippet", "q": f"{query} {niche} {language}", "type": "video",
-            "maxResults": max_results, "order": "date", "regionCode": "IN",
-            "publishedAfter": (datetime.datetime.utcnow() - datetime.timedelta(days=7)).isoformat("T") + "Z",
-            "key": api_key
-        }
+        """Fetches one query and writes the whole page with a single bulk_write per collection."""
+        items = self.fetch_video_items(query, niche, state, language, max_results) or []
+        writer = BulkWriter()
         try:
-            response = requests.get(search_url, params=params)
-            if response.status_code == 403:
-                self.increment_quota(key_usage, cost=10000)
-                return self.fetch_videos(query, niche, state, language, max_results)
-            self.increment_quota(key_usage, cost=100)
-            if response.status_code != 200:
-                return []
-            video_ids = [item["id"]["videoId"] for item in response.json().get("items", [])]
-            if not video_ids: return []
-            videos_url = "https://www.googleapis.com/youtube/v3/videos"
-            v_params = {"part": "snippet,contentDetails,statistics", "id": ",".join(video_ids), "key": api_key}
-            v_response = requests.get(videos_url, params=v_params)
-            self.increment_quota(key_usage, cost=1)
-            if v_response.status_code != 200:
-                return []
-            for item in v_response.json().get("items", []):
-                self._process_video_item(item, niche, state, language)
-            logger.info(f"Successfully fetched {len(video_ids)} videos for '{niche} | {state} | {language}'")
+            self.queue_video_items(writer, items, niche, state, language)
+            result = writer.flush()
+            if items:
+                logger.info(f"Successfully fetched {len(items)} videos for '{niche} | {state} | {language}' ({result['inserted']} inserted, {result['modified']} modified, {result['failed']} failed)")
         except Exception as e:
             logger.error(f"Exception in fetch_videos: {e}")
-            return []
+        return items
+
+    def queue_video_items(self, writer, items, niche, state, language):
+        """Adds the channel and video upserts for `items` to a BulkWriter. Returns the viral scores of the queued videos."""
+        ops, scores = self.build_page_ops(items, niche, state, language)
+        for collection, op, key in ops:
+            writer.add(collection, op, key=key)
+        return scores
+
+    def build_page_ops(self, items, niche, state, language):
+        """
+        Parses and scores a page of videos.list items without touching the database.
+        Returns ([(collection, op, key), ...], scores); malformed items are skipped.
+        """
+        ops, scores = [], []
+        for item in items:
+            try:
+                channel_op, video_op, video_data = self.build_video_ops(item, niche, state, language)
+            except Exception as e:
+                logger.error(f"Skipping malformed video item {item.get('id')}: {e}")
+                continue
+            ops.append((channels_collection, channel_op, item["snippet"]["channelId"]))
+            ops.append((videos_collection, video_op, item["id"]))
+            scores.append(video_data["viral_score"])
+        return ops, scores
 
-    def _process_video_item(self, item, niche, state, language):
+    def build_video_ops(self, item, niche, state, language):
+        """Returns the channel upsert, the video upsert and the video document for one videos.list item."""
         video_id = item["id"]
         snippet = item["snippet"]
         channel_id = snippet["channelId"]
         
-        channels_collection.update_one(
+        channel_op = UpdateOne(
             {"channel_id": channel_id},
             {"$setOnInsert": {
                 "channel_name": snippet["channelTitle"], "language": language,
@@ -139,22 +207,12 @@ class YouTubeService:
         }
         video_data["viral_score"] = self.calculate_viral_score(video_data)
         
-        videos_collection.update_one(
+        video_op = UpdateOne(
             {"video_id": video_id},
             {"$set": video_data},
             upsert=True
         )
+        return channel_op, video_op, video_data
 
     def calculate_viral_score(self, video_data):
-        # ... (code is unchanged)
-        age_hours = max((datetime.datetime.utcnow() - video_data["published_at"]).total_seconds() / 3600, 0.1)
-        views_per_hour = video_data.get("view_count", 0) / age_hours
-        engagement_ratio = 0
-        if video_data.get("view_count", 0) > 0:
-            engagement_ratio = (video_data.get("like_count", 0) + (video_data.get("comment_count", 0) * 2)) / video_data["view_count"]
-        score = views_per_hour * (1 + engagement_ratio * 10)
-        if video_data.get("is_short", False): score *= 1.5
-        state_lang_map = {"Maharashtra": "Marathi", "Tamil Nadu": "Tamil", "Andhra Pradesh": "Telugu", "Telangana": "Telugu", "Karnataka": "Kannada", "Kerala": "Malayalam", "West Bengal": "Bengali", "Gujarat": "Gujarati", "Punjab": "Punjabi"}
-        if video_data.get("state") in state_lang_map and video_data.get("language") == state_lang_map[video_data["state"]]:
-            score *= 1.2
-        return score
+        return score_video(video_data, self.weights)
@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, Header, Body, Query
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from typing import Optional, Annotated, List
 from datetime import datetime
 import logging
+from pymongo.errors import DuplicateKeyError
 
-from .database import users_collection, user_activity_collection, user_follows_collection, videos_collection
-from .firebase_config import verify_token, auth as firebase_auth
+from .database import async_users_collection, async_videos_collection, normalize_username
+from .firebase_config import verify_token, verify_id_token
+from .services.activity_buffer import activity_buffer, EVENT_TYPES
+from .services.personalization import affinity_cache
+from .config import settings
 
 router = APIRouter()
 logger = logging.getLogger("uvicorn")
@@ -32,6 +37,9 @@ class UserActivity(BaseModel):
     duration_watched: int = 0
     paused_at: Optional[float] = None
 
+class ActivityBatch(BaseModel):
+    events: List[UserActivity] = Field(..., max_length=settings.ACTIVITY_BATCH_MAX_EVENTS)
+
 class UserFollow(BaseModel):
     channel_id: str
 
@@ -53,6 +61,16 @@ def get_current_user(authorization: Annotated[str | None, Header()] = None):
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     return uid
 
+async def get_bearer_token(authorization: Annotated[str | None, Header()] = None):
+    """
+    The unverified Bearer token, or None for anonymous requests. Async and without verification,
+    so routes where auth is optional only pay for verify_token when they need the uid.
+    """
+    parts = authorization.split() if authorization else []
+    if len(parts) != 2 or parts[0] != "Bearer":
+        return None
+    return parts[1]
+
 # --- Helper to format user profile ---
 def _format_user_profile(db_user):
     return {
@@ -66,23 +84,31 @@ def _format_user_profile(db_user):
         "bio": db_user.get("bio")
     }
 
+# --- Username matching ---
+# Usernames are matched case-insensitively through `username_lower`, a normalized copy with a
+# unique index, so lookups are an index seek and search is an index range scan.
+def _prefix_range(prefix):
+    """Range query matching every string that starts with `prefix`: [prefix, prefix with its last character incremented)."""
+    return {"$gte": prefix, "$lt": prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
 # --- User API Endpoints ---
 
 @router.post("/user/google-login")
-def google_login(data: GoogleLoginRequest):
+async def google_login(data: GoogleLoginRequest):
     """
     Handles user login/registration via Google ID Token.
     Verifies the token, creates a user if they don't exist, and returns the full user profile.
     """
     try:
-        decoded_token = firebase_auth.verify_id_token(data.id_token)
+        # Signature verification is CPU-bound; keep it off the event loop
+        decoded_token = await run_in_threadpool(verify_id_token, data.id_token)
         uid = decoded_token['uid']
     except Exception as e:
         logger.error(f"Invalid Google token: {e}")
         raise HTTPException(status_code=401, detail=f"Invalid or expired Google token: {e}")
 
     # Check if user exists
-    user = users_collection.find_one({"uid": uid})
+    user = await async_users_collection.find_one({"uid": uid})
     
     if user:
         # User exists, return their profile
@@ -99,59 +125,68 @@ def google_login(data: GoogleLoginRequest):
             "created_at": datetime.utcnow(),
             "last_updated": datetime.utcnow()
         }
-        users_collection.insert_one(new_user_data)
+        await async_users_collection.insert_one(new_user_data)
         return {"new_user": True, "profile": _format_user_profile(new_user_data)}
 
 
 @router.post("/user/register")
-def register_user(data: UserRegistration, uid: str = Depends(get_current_user)):
+async def register_user(data: UserRegistration, uid: str = Depends(get_current_user)):
     """
     Registers a new user with username, email, and display name.
     Checks if username is already taken.
     """
     # Check if username exists (case insensitive)
-    existing_user = users_collection.find_one({"username": {"$regex": f"^{data.username}$", "$options": "i"}})
+    username_lower = normalize_username(data.username)
+    existing_user = await async_users_collection.find_one({"username_lower": username_lower}, {"uid": 1})
     if existing_user and existing_user.get("uid") != uid:
         raise HTTPException(status_code=400, detail="User ID already taken")
 
-    users_collection.update_one(
-        {"uid": uid},
-        {"$set": {
-            "username": data.username,
-            "email": data.email,
-            "display_name": data.display_name,
-            "created_at": datetime.utcnow(),
-            "last_updated": datetime.utcnow()
-        }},
-        upsert=True
-    )
+    try:
+        await async_users_collection.update_one(
+            {"uid": uid},
+            {"$set": {
+                "username": data.username,
+                "username_lower": username_lower,
+                "email": data.email,
+                "display_name": data.display_name,
+                "created_at": datetime.utcnow(),
+                "last_updated": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another user registered the same name between the check and the write
+        raise HTTPException(status_code=400, detail="User ID already taken")
     return {"status": "User registered successfully"}
 
 @router.post("/user/lookup")
-def lookup_email_by_username(data: UsernameLookup):
+async def lookup_email_by_username(data: UsernameLookup):
     """
     Looks up an email address by username (User ID).
     Used for login when user enters a username instead of email.
     """
-    user = users_collection.find_one({"username": {"$regex": f"^{data.username}$", "$options": "i"}})
+    user = await async_users_collection.find_one({"username_lower": normalize_username(data.username)}, {"email": 1})
     if user and "email" in user:
         return {"email": user["email"]}
     raise HTTPException(status_code=404, detail="User ID not found")
 
 @router.get("/user/search")
-def search_users(q: str = Query(..., min_length=1)):
+async def search_users(q: str = Query(..., min_length=1)):
     """
-    Searches for users by username (User ID).
+    Searches for users whose username (User ID) starts with `q`, case-insensitively.
     Returns a list of matching users with their basic info.
     """
-    users = list(users_collection.find(
-        {"username": {"$regex": q, "$options": "i"}},
+    prefix = normalize_username(q)
+    if not prefix:
+        return []
+    users = await async_users_collection.find(
+        {"username_lower": _prefix_range(prefix)},
         {"username": 1, "photo_url": 1, "bio": 1, "_id": 0}
-    ).limit(20))
+    ).sort("username_lower", 1).limit(20).to_list()
     return users
 
 @router.post("/user/profile")
-def update_user_profile(profile: UserProfile, uid: str = Depends(get_current_user)):
+async def update_user_profile(profile: UserProfile, uid: str = Depends(get_current_user)):
     """Creates or updates a user's profile."""
     update_data = {"last_updated": datetime.utcnow()}
     if profile.state: update_data["state"] = profile.state
@@ -160,7 +195,7 @@ def update_user_profile(profile: UserProfile, uid: str = Depends(get_current_use
     if profile.bio is not None: update_data["bio"] = profile.bio
     if profile.display_name: update_data["display_name"] = profile.display_name
 
-    users_collection.update_one(
+    await async_users_collection.update_one(
         {"uid": uid},
         {"$set": update_data},
         upsert=True
@@ -168,16 +203,31 @@ def update_user_profile(profile: UserProfile, uid: str = Depends(get_current_use
     return {"status": "Profile updated successfully"}
 
 @router.get("/user/profile")
-def get_user_profile(uid: str = Depends(get_current_user)):
+async def get_user_profile(uid: str = Depends(get_current_user)):
     """Retrieves a user's profile."""
-    user_profile = users_collection.find_one({"uid": uid}, {"_id": 0})
+    user_profile = await async_users_collection.find_one({"uid": uid}, {"_id": 0})
     if user_profile:
         return _format_user_profile(user_profile)
     raise HTTPException(status_code=404, detail="User profile not found")
 
+@router.post("/user/activity/batch")
+async def record_activity(batch: ActivityBatch, uid: str = Depends(get_current_user)):
+    """
+    Records a batch of watch events (view, replay, like, unlike, pause) for the current user.
+    Events are merged in memory per video and written with periodic bulk upserts, so the
+    response does not wait for the database.
+    """
+    unknown = {event.event_type for event in batch.events} - EVENT_TYPES
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event types: {sorted(unknown)}")
+    activity_buffer.add(uid, [event.model_dump() for event in batch.events])
+    # Personalized feeds stop showing these videos right away, not only after the next flush and affinity reload
+    affinity_cache.note_watched(uid, {event.video_id for event in batch.events if event.event_type in ("view", "replay")})
+    return {"accepted": len(batch.events)}
+
 # --- Feed Endpoint ---
 @router.get("/feed")
-def get_feed(state: Optional[str] = None, language: Optional[str] = None, limit: int = 20):
+async def get_feed(state: Optional[str] = None, language: Optional[str] = None, limit: int = 20):
     """
     Gets a personalized feed based on state and language.
     Falls back to global if no personalization is provided.
@@ -190,11 +240,11 @@ def get_feed(state: Optional[str] = None, language: Optional[str] = None, limit:
     elif language:
         query = {"language": language}
 
-    videos = list(videos_collection.find(query).sort("viral_score", -1).limit(limit))
+    videos = await async_videos_collection.find(query).sort("viral_score", -1).limit(limit).to_list()
     
     # If personalized feed is empty, fall back to global
     if not videos:
-        videos = list(videos_collection.find({}).sort("viral_score", -1).limit(limit))
+        videos = await async_videos_collection.find({}).sort("viral_score", -1).limit(limit).to_list()
 
     return videos
 
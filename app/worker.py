@@ -0,0 +1,32 @@
+"""
+Worker process: runs the periodic jobs, so web workers only serve requests.
+
+    python -m app.worker
+"""
+import logging
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from .database import ensure_indexes
+from .jobs import schedule_jobs
+from .config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("uvicorn")
+
+
+def main():
+    if settings.CREATE_INDEXES_ON_STARTUP:
+        created = ensure_indexes()
+        if created:
+            logger.info(f"✅ Created {len(created)} missing indexes: {created}")
+    scheduler = BlockingScheduler()
+    schedule_jobs(scheduler)
+    logger.info("Worker scheduler started.")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Worker scheduler shut down.")
+
+
+if __name__ == "__main__":
+    main()
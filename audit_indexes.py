@@ -0,0 +1,95 @@
+"""
+Runs explain() on every query shape issued by feed_routes.py, user_routes.py,
+personalization.py and viral_engine.py and flags plans that scan the whole collection (COLLSCAN) or sort in
+memory (SORT). Run it against a populated database; on empty collections the planner
+has nothing to choose between.
+
+    python audit_indexes.py
+"""
+import sys
+import datetime
+
+from app.database import get_db
+
+NOW = datetime.datetime.utcnow()
+STATE, LANGUAGE = "Tamil Nadu", "Tamil"
+RECENT_AFTER = {"$or": [
+    {"published_at": {"$lt": NOW}},
+    {"published_at": NOW, "video_id": {"$lt": "zzzzzzzzzzz"}},
+]}
+RANK = [("rank", 1)]
+RECENT = [("published_at", -1), ("video_id", -1)]
+BY_SCORE = [("viral_score", -1)]
+
+# (source, collection, filter, sort, limit, expected stages). A shape may list stages it is
+# expected to use, e.g. the rebuild scan reads every video on purpose.
+QUERY_SHAPES = [
+    # feed_routes._read_tier, for each tier of _tier_chain, for each ranking (all, shorts, non-shorts) and with a cursor
+    ("feed_routes._read_tier STATE_LANGUAGE", "viral_index", {"viral_type": "STATE_LANGUAGE", "state": STATE, "language": LANGUAGE, "shorts": None}, RANK, 20, ()),
+    ("feed_routes._read_tier LANGUAGE", "viral_index", {"viral_type": "LANGUAGE", "state": None, "language": LANGUAGE, "shorts": None}, RANK, 20, ()),
+    ("feed_routes._read_tier STATE", "viral_index", {"viral_type": "STATE", "state": STATE, "language": None, "shorts": None}, RANK, 20, ()),
+    ("feed_routes._read_tier GLOBAL", "viral_index", {"viral_type": "GLOBAL", "state": None, "language": None, "shorts": None}, RANK, 20, ()),
+    ("feed_routes._read_tier is_short", "viral_index", {"viral_type": "STATE_LANGUAGE", "state": STATE, "language": LANGUAGE, "shorts": True}, RANK, 20, ()),
+    ("feed_routes._read_tier cursor", "viral_index", {"viral_type": "GLOBAL", "state": None, "language": None, "shorts": None, "rank": {"$gt": 20}}, RANK, 20, ()),
+    ("feed_routes._read_tier is_short cursor", "viral_index", {"viral_type": "GLOBAL", "state": None, "language": None, "shorts": False, "rank": {"$gt": 20}}, RANK, 20, ()),
+    # feed_routes._read_recent, the published_at fallback
+    ("feed_routes._read_recent", "videos", {}, RECENT, 20, ()),
+    ("feed_routes._read_recent is_short", "videos", {"is_short": True}, RECENT, 20, ()),
+    ("feed_routes._read_recent cursor", "videos", RECENT_AFTER, RECENT, 20, ()),
+    ("feed_routes._read_recent is_short cursor", "videos", dict(RECENT_AFTER, is_short=True), RECENT, 20, ()),
+    ("feed_routes._read_recent after the tiers", "videos", dict(RECENT_AFTER, video_id={"$nin": ["a", "b", "c"]}), RECENT, 20, ()),
+    ("feed_routes._tier_video_ids", "viral_index", {"viral_type": "STATE", "state": STATE, "language": None, "shorts": None}, None, 0, ()),
+    # feed_routes._load_videos and get_video_details
+    ("feed_routes._load_videos", "videos", {"video_id": {"$in": ["a", "b", "c"]}}, None, 0, ()),
+    ("feed_routes.get_video_details", "videos", {"video_id": "a"}, None, 1, ()),
+    # user_routes
+    ("user_routes.get_current_user/profile", "users", {"uid": "a"}, None, 1, ()),
+    ("user_routes.register_user/lookup", "users", {"username_lower": "someone"}, None, 1, ()),
+    ("user_routes.search_users", "users", {"username_lower": {"$gte": "some", "$lt": "somf"}}, [("username_lower", 1)], 20, ()),
+    ("user_routes.get_feed state+language", "videos", {"state": STATE, "language": LANGUAGE}, BY_SCORE, 20, ()),
+    ("user_routes.get_feed state", "videos", {"state": STATE}, BY_SCORE, 20, ()),
+    ("user_routes.get_feed language", "videos", {"language": LANGUAGE}, BY_SCORE, 20, ()),
+    ("user_routes.get_feed global", "videos", {}, BY_SCORE, 20, ()),
+    # personalization.load_affinity
+    ("personalization.load_affinity activity", "user_activity", {"uid": "a"}, [("last_event_at", -1)], 500, ()),
+    ("personalization.load_affinity follows", "user_follows", {"uid": "a"}, None, 0, ()),
+    # viral_engine: the rebuild reads every video once by design
+    ("viral_engine.compute_tiers / rescore_all", "videos", {}, None, 0, ("COLLSCAN",)),
+]
+
+FLAGGED = ("COLLSCAN", "SORT")
+
+
+def plan_stages(plan):
+    """Every stage name in an explain plan tree (classic and slot-based engine layouts)."""
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("queryPlan", "inputStage", "outerStage", "innerStage"):
+        stages += plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+def audit():
+    db = get_db()
+    problems = 0
+    for source, collection, query, sort, limit, expected in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        planner = cursor.explain()["queryPlanner"]
+        stages = plan_stages(planner["winningPlan"])
+        flagged = [stage for stage in stages if stage in FLAGGED and stage not in expected]
+        problems += bool(flagged)
+        status = "❌ " + ", ".join(flagged) if flagged else "✅"
+        print(f"{status:14s} {source:45s} {' > '.join(stages)}")
+    print(f"\n{problems} of {len(QUERY_SHAPES)} query shapes need an index." if problems else "\nEvery query shape is served by an index.")
+    return problems
+
+
+if __name__ == "__main__":
+    sys.exit(1 if audit() else 0)
@@ -0,0 +1,134 @@
+"""
+Measures the memory the candidate store needs per 100k ranked videos, next to the full video
+documents (with description and tags) that feed reads used to turn into dicts, and times
+lookups by video_id and by tier. Checks every tier page against a plain sort of its entries.
+No queries are made.
+
+    python -m benchmarks.candidate_store --videos 100000
+"""
+import argparse
+import datetime
+import random
+import time
+import tracemalloc
+
+from app.constants import STATES, LANGUAGES, STATE_LANGUAGE_MAP
+from app.services.candidate_store import CandidateStore
+
+NICHES = ["comedy", "music", "news", "cooking", "devotional", "movies", "sports", "tech"]
+
+
+def synthetic_documents(count, channels):
+    """Video documents shaped like youtube_service.build_video_ops output, with a few tags."""
+    rng = random.Random(42)
+    now = datetime.datetime.utcnow()
+    docs = []
+    for i in range(count):
+        state = rng.choice(STATES)
+        channel = rng.randrange(channels)
+        docs.append({
+            "video_id": f"bench{i:06d}",
+            "title": f"Video {i} " + "x" * rng.randint(20, 80),
+            "description": "Description line. " * rng.randint(5, 40),
+            "tags": [f"tag{rng.randint(0, 5000)}" for _ in range(rng.randint(3, 15))],
+            # Built per document, as decoded BSON gives each document its own string objects
+            "channel_id": "".join(["UC", f"{channel:022d}"]),
+            "channel_title": "".join(["Channel ", str(channel)]),
+            "channel_thumbnail": "".join(["https://yt3.ggpht.com/", str(channel)]),
+            "niche": "".join([rng.choice(NICHES)]),
+            "state": "".join([state]),
+            "language": "".join([STATE_LANGUAGE_MAP.get(state) or rng.choice(LANGUAGES)]),
+            "published_at": now - datetime.timedelta(seconds=rng.randint(0, 30 * 86400)),
+            "view_count": rng.randint(0, 10_000_000),
+            "like_count": rng.randint(0, 100_000),
+            "comment_count": rng.randint(0, 10_000),
+            "viral_score": rng.uniform(0, 10),
+            "is_short": rng.random() < 0.4,
+            "thumbnail_url": f"https://i.ytimg.com/vi/bench{i:06d}/hqdefault.jpg",
+        })
+    return docs
+
+
+def synthetic_entries(docs):
+    """viral_index entries: every video in its STATE_LANGUAGE, STATE and LANGUAGE tiers, the top ones in GLOBAL."""
+    tiers = {}
+    for doc in docs:
+        for key in (("STATE_LANGUAGE", doc["state"], doc["language"]), ("STATE", doc["state"], None),
+                    ("LANGUAGE", None, doc["language"])):
+            tiers.setdefault(key, []).append(doc)
+    tiers[("GLOBAL", None, None)] = sorted(docs, key=lambda d: -d["viral_score"])[:1000]
+    entries = []
+    for (viral_type, state, language), members in tiers.items():
+        members = sorted(members, key=lambda d: -d["viral_score"])
+        # Each tier is ranked over all videos, shorts only and non-shorts only, like compute_tiers
+        for shorts in (None, True, False):
+            ranked = [d for d in members if shorts is None or d["is_short"] == shorts]
+            for rank, doc in enumerate(ranked, 1):
+                entries.append({
+                    "video_id": doc["video_id"], "viral_type": viral_type, "state": state, "language": language,
+                    "shorts": shorts, "rank": rank, "score": doc["viral_score"], "is_short": doc["is_short"],
+                    "last_updated": datetime.datetime.utcnow(),
+                })
+    return entries, tiers
+
+
+def traced(fn):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def check(store, tiers):
+    for key, members in tiers.items():
+        for is_short in (None, True, False):
+            expected = [d["video_id"] for d in sorted(members, key=lambda d: -d["viral_score"]) if is_short is None or d["is_short"] == is_short]
+            first = store.page(key, is_short, 0, 20)
+            assert [c.video_id for _, c in first] == expected[:20], f"first page of {key} differs"
+            if first:
+                after = store.page(key, is_short, 0, 20, after_rank=first[-1][0])
+                assert [c.video_id for _, c in after] == expected[20:40], f"second page of {key} differs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=100_000)
+    parser.add_argument("--channels", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    docs = synthetic_documents(args.videos, args.channels)
+    entries, tiers = synthetic_entries(docs)
+    per_100k = 100_000 / args.videos
+
+    # Both sides get freshly built documents, like decoded query results: what the feed held
+    # before (full documents), and what the store keeps of them once the rest is dropped
+    full, full_bytes = traced(lambda: synthetic_documents(args.videos, args.channels))
+    del full
+    store = CandidateStore()
+    _, store_bytes = traced(lambda: store.build(entries, synthetic_documents(args.videos, args.channels)))
+    check(store, tiers)
+
+    print(f"{len(docs):,} videos in {len(tiers)} tiers, {len(entries):,} viral_index entries")
+    print(f"{'full documents':28s} {full_bytes * per_100k / 2**20:9.1f} MiB per 100k videos")
+    print(f"{'candidate store':28s} {store_bytes * per_100k / 2**20:9.1f} MiB per 100k videos")
+    print(f"{'memory() estimate':28s} {store.memory()['bytes_per_100k'] / 2**20:9.1f} MiB per 100k videos")
+
+    rng = random.Random(7)
+    ids = [rng.choice(docs)["video_id"] for _ in range(args.lookups)]
+    started = time.perf_counter()
+    for video_id in ids:
+        store.get(video_id)
+    print(f"{'lookup by video_id':28s} {(time.perf_counter() - started) / len(ids) * 1e6:9.2f} µs")
+    keys = list(tiers)
+    pages = [(rng.choice(keys), rng.choice([None, True, False]), rng.randint(1, 500)) for _ in range(args.lookups)]
+    started = time.perf_counter()
+    for key, is_short, after_rank in pages:
+        store.page(key, is_short, 0, 20, after_rank)
+    print(f"{'page of 20 by tier':28s} {(time.perf_counter() - started) / len(pages) * 1e6:9.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Per-page serialization cost of a 20-item feed page: per-request encoding (old path) vs
+serving pre-rendered bytes from the feed cache (new path). No queries are made.
+
+    python -m benchmarks.feed_serialization
+"""
+import argparse
+import datetime
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.feed_routes import _format_video_for_feed
+from app.responses import RawJSONResponse, dumps, orjson, pack, unpack
+
+
+def synthetic_page(size):
+    now = datetime.datetime.utcnow()
+    return [{
+        "video_id": f"vid{i:08d}",
+        "title": f"Synthetic trending video number {i} | Full HD",
+        "channel_title": f"Channel {i % 7}",
+        "channel_thumbnail": None,
+        "like_count": 1000 + i,
+        "comment_count": 10 + i,
+        "is_short": i % 2 == 0,
+        "published_at": now,
+    } for i in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    docs = synthetic_page(args.page_size)
+    cached = pack(dumps([_format_video_for_feed(v) for v in docs]), {"X-Next-Cursor": "abc", "X-Feed-Tier": "GLOBAL"})
+
+    def per_request():
+        # What FastAPI did for every request: format, jsonable_encoder, then JSON-encode the body
+        JSONResponse(content=jsonable_encoder([_format_video_for_feed(v) for v in docs]))
+
+    def render_once():
+        # Cache miss: format and render to bytes once per generation
+        pack(dumps([_format_video_for_feed(v) for v in docs]), {})
+
+    def pre_rendered():
+        # Cache hit: bytes go straight into the response
+        body, headers = unpack(cached)
+        RawJSONResponse(content=body, headers=headers)
+
+    print(f"Encoder: {'orjson' if orjson else 'json (install orjson for faster misses)'}, page size {args.page_size}")
+    for name, fn in (("per-request encoding", per_request), ("render once (miss)", render_once), ("pre-rendered (hit)", pre_rendered)):
+        seconds = timeit.timeit(fn, number=args.number)
+        print(f"{name:24s} {seconds / args.number * 1e6:8.1f} µs/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Closed-loop load test for the feed, video-detail and user endpoints of a running server.
+
+Run it against the server before and after a change to compare requests/sec and p99 latency:
+
+    pip install httpx
+    uvicorn app.main:app --port 8000 --workers 1
+    python -m benchmarks.load_test --url http://localhost:8000 --clients 300 --seconds 30
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from app.constants import STATES, LANGUAGES
+
+
+def pick_request(rng, video_ids):
+    roll = rng.random()
+    if roll < 0.7:
+        body = {"state": rng.choice(STATES), "language": rng.choice(LANGUAGES), "limit": 20, "skip": 20 * rng.randint(0, 2)}
+        if rng.random() < 0.5:
+            body["is_short"] = True
+        return "POST", "/api/feed", body
+    if roll < 0.9 and video_ids:
+        return "GET", f"/api/video/{rng.choice(video_ids)}", None
+    return "GET", "/api/user/search", {"q": rng.choice("abcdefghij")}
+
+
+async def client_loop(http, deadline, latencies, errors, seed, video_ids):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        method, path, payload = pick_request(rng, video_ids)
+        started = time.perf_counter()
+        try:
+            if method == "POST":
+                response = await http.post(path, json=payload)
+            else:
+                response = await http.get(path, params=payload)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(url, clients, seconds):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as http:
+        # Real video ids make the detail requests hit the database instead of 404ing
+        feed = await http.post("/api/feed", json={"limit": 50})
+        video_ids = [v["video_id"] for v in feed.json()] if feed.status_code == 200 else []
+
+        latencies, errors = [], []
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(http, deadline, latencies, errors, i, video_ids) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+    print(f"Clients: {clients}, duration: {elapsed:.1f}s, requests: {len(latencies)}, errors: {len(errors)}")
+    print(f"Throughput: {len(latencies) / elapsed:.0f} req/s")
+    print(f"Latency p50: {percentile(0.50):.1f} ms, p99: {percentile(0.99):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--seconds", type=float, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.clients, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
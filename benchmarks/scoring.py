@@ -0,0 +1,81 @@
+"""
+Scores synthetic videos one at a time with score_video (ingest path) and in one vectorized pass
+with ScoreColumns.scores (rebuild path), checks that both give the same scores, and times them.
+No queries are made.
+
+    python -m benchmarks.scoring --videos 1000000
+"""
+import argparse
+import datetime
+import random
+import time
+
+import numpy as np
+
+from app.constants import STATES, LANGUAGES, STATE_LANGUAGE_MAP
+from app.services.scoring import ScoreColumns, ScoreWeights, DEFAULT_WEIGHTS, score_video
+
+
+def synthetic_videos(count, now):
+    rng = random.Random(42)
+    states = STATES + ["Goa", None]  # includes a state outside the vocabulary and a missing one
+    languages = LANGUAGES + [None]
+    videos = []
+    for i in range(count):
+        state = rng.choice(states)
+        # Make regional matches common enough to exercise the boost
+        language = STATE_LANGUAGE_MAP.get(state) if rng.random() < 0.3 else rng.choice(languages)
+        video = {
+            "video_id": f"bench{i:08d}",
+            "published_at": now - datetime.timedelta(seconds=rng.randint(0, 30 * 86400)),
+            "view_count": rng.choice([0, rng.randint(1, 10_000_000)]),
+            "like_count": rng.randint(0, 100_000),
+            "comment_count": rng.randint(0, 10_000),
+            "is_short": rng.random() < 0.4,
+            "state": state,
+            "language": language,
+        }
+        videos.append({k: v for k, v in video.items() if v is not None})
+    return videos
+
+
+def check(videos, columns, weights):
+    expected = np.array([score_video(v, weights) for v in videos])
+    actual = columns.scores(weights)
+    mismatches = np.flatnonzero(~np.isclose(actual, expected, rtol=0.0, atol=1e-9))
+    assert not len(mismatches), f"{len(mismatches)} scores differ, first: {videos[mismatches[0]]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=200000)
+    args = parser.parse_args()
+
+    # Whole milliseconds, the precision MongoDB stores dates with
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    videos = synthetic_videos(args.videos, now)
+
+    start = time.perf_counter()
+    columns = ScoreColumns.from_documents(videos)
+    load_seconds = time.perf_counter() - start
+
+    for weights in (DEFAULT_WEIGHTS, ScoreWeights(engagement=4, comment_weight=3, short_boost=1.1, regional_boost=2, decay_hours=6)):
+        check(videos, columns, weights)
+    print(f"✅ Vectorized scores match score_video for {len(videos)} videos (default and custom weights).")
+
+    start = time.perf_counter()
+    for video in videos:
+        score_video(video, DEFAULT_WEIGHTS)
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns.scores(DEFAULT_WEIGHTS)
+    vector_seconds = time.perf_counter() - start
+
+    print(f"{'build columns':24s} {load_seconds:8.3f} s")
+    print(f"{'score_video loop':24s} {scalar_seconds:8.3f} s")
+    print(f"{'ScoreColumns.scores':24s} {vector_seconds:8.3f} s  ({scalar_seconds / vector_seconds:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Measures how long a fresh worker process takes to import the app, which is the time
+before uvicorn can start serving. Each run uses a new interpreter so nothing is cached.
+
+    python -m benchmarks.startup_time --runs 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """
+import time
+started = time.perf_counter()
+import app.main
+print(time.perf_counter() - started)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, "-c", SNIPPET], capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+
+    print(f"import app.main over {args.runs} runs: "
+          f"median {statistics.median(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
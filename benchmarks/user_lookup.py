@@ -0,0 +1,92 @@
+"""
+Compares the old case-insensitive $regex username queries with username_lower lookups
+(exact match and prefix range) on a synthetic users collection.
+
+Seeds users into a scratch database (<MONGO_DB_NAME>_bench) on MONGO_URI.
+
+    python -m benchmarks.user_lookup --users 1000000
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from pymongo import MongoClient
+
+from app.config import settings
+from app.database import INDEXES
+from app.user_routes import normalize_username, _prefix_range
+
+
+def seed(users, count):
+    users.drop()
+    users.create_indexes(INDEXES["users"])
+
+    rng = random.Random(42)
+    batch = []
+    for i in range(count):
+        # Mixed-case names with a unique numeric suffix
+        name = "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(4, 10))) + str(i)
+        batch.append({
+            "uid": f"uid{i:08d}", "username": name, "username_lower": normalize_username(name),
+            "email": f"user{i}@example.com", "photo_url": None, "bio": "",
+        })
+        if len(batch) == 10000:
+            users.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        users.insert_many(batch, ordered=False)
+
+
+def timed(fn, queries):
+    started = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - started) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data from a previous run")
+    args = parser.parse_args()
+
+    client = MongoClient(settings.MONGO_URI)
+    users = client[f"{settings.MONGO_DB_NAME}_bench"]["users"]
+
+    if not args.skip_seed:
+        print(f"Seeding {args.users:,} synthetic users into '{users.database.name}'...")
+        started = time.perf_counter()
+        seed(users, args.users)
+        print(f"  seeded in {time.perf_counter() - started:.1f}s")
+
+    sample = [u["username"] for u in users.aggregate([{"$sample": {"size": args.queries}}, {"$project": {"username": 1}}])]
+    exact = [name.swapcase() for name in sample]
+    prefixes = [name[:3] for name in sample]
+    projection = {"username": 1, "photo_url": 1, "bio": 1, "_id": 0}
+
+    # The queries user_routes ran before: unescaped, case-insensitive regexes
+    regex_exact = lambda name: users.find_one({"username": {"$regex": f"^{name}$", "$options": "i"}})
+    regex_search = lambda q: users.find({"username": {"$regex": q, "$options": "i"}}, projection).limit(20).to_list()
+    # The queries it runs now
+    lower_exact = lambda name: users.find_one({"username_lower": normalize_username(name)})
+    prefix_search = lambda q: users.find(
+        {"username_lower": _prefix_range(normalize_username(q))}, projection
+    ).sort("username_lower", 1).limit(20).to_list()
+
+    assert all(lower_exact(name) for name in exact), "an exact lookup missed"
+    for q in prefixes[:5]:
+        assert all(u["username"].lower().startswith(q.lower()) for u in prefix_search(q))
+        matching = users.count_documents({"username": {"$regex": f"^{re.escape(q)}", "$options": "i"}})
+        assert len(prefix_search(q)) == min(20, matching), f"prefix search for '{q}' missed users"
+
+    print(f"{'regex exact lookup':28s} {timed(regex_exact, exact):9.2f} ms/query")
+    print(f"{'username_lower lookup':28s} {timed(lower_exact, exact):9.2f} ms/query")
+    print(f"{'regex substring search':28s} {timed(regex_search, prefixes):9.2f} ms/query")
+    print(f"{'username_lower prefix range':28s} {timed(prefix_search, prefixes):9.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares the old per-partition ranking queries with ViralEngine.compute_tiers.
+
+Seeds synthetic videos into a scratch database (<MONGO_DB_NAME>_bench) on MONGO_URI.
+
+    python -m benchmarks.viral_ranking --videos 1000000
+"""
+import argparse
+import random
+import time
+
+import pymongo
+from pymongo import MongoClient
+
+from app.config import settings
+from app.constants import STATES, LANGUAGES
+from app.services.viral_engine import ViralEngine
+
+
+def seed(videos, count):
+    videos.drop()
+    videos.create_index("video_id", unique=True)
+    videos.create_index([("state", 1), ("language", 1)])
+    videos.create_index("viral_score")
+    videos.create_index([("state", 1)])
+    videos.create_index([("language", 1)])
+
+    rng = random.Random(42)
+    batch = []
+    for i in range(count):
+        batch.append({
+            "video_id": f"bench{i:08d}",
+            "title": f"Synthetic video {i}",
+            "description": "x" * 300,
+            "state": rng.choice(STATES),
+            "language": rng.choice(LANGUAGES),
+            "viral_score": rng.lognormvariate(5, 2),
+            "view_count": rng.randint(0, 10_000_000),
+        })
+        if len(batch) == 10000:
+            videos.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        videos.insert_many(batch, ordered=False)
+
+
+def legacy_tiers(videos):
+    """The ranking queries update_viral_indices ran before the single-pass engine."""
+    tiers = {}
+    top = lambda query, n: [(v["viral_score"], v["video_id"]) for v in videos.find(query).sort("viral_score", pymongo.DESCENDING).limit(n)]
+
+    tiers[("GLOBAL", None, None)] = top({}, 100)
+    for state in videos.distinct("state"):
+        if state:
+            tiers[("STATE", state, None)] = top({"state": state}, 50)
+    for lang in videos.distinct("language"):
+        if lang:
+            tiers[("LANGUAGE", None, lang)] = top({"language": lang}, 50)
+    for combo in videos.aggregate([{"$group": {"_id": {"state": "$state", "language": "$language"}}}]):
+        state, lang = combo["_id"].get("state"), combo["_id"].get("language")
+        if state and lang:
+            tiers[("STATE_LANGUAGE", state, lang)] = top({"state": state, "language": lang}, 50)
+    return tiers
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=1_000_000)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data from a previous run")
+    args = parser.parse_args()
+
+    client = MongoClient(settings.MONGO_URI)
+    bench_db = client[f"{settings.MONGO_DB_NAME}_bench"]
+    videos = bench_db["videos"]
+
+    if not args.skip_seed:
+        print(f"Seeding {args.videos:,} synthetic videos into '{bench_db.name}'...")
+        _, seconds = timed(seed, videos, args.videos)
+        print(f"  seeded in {seconds:.1f}s")
+
+    legacy, legacy_seconds = timed(legacy_tiers, videos)
+    engine = ViralEngine(videos=videos, viral_index=bench_db["viral_index"])
+    single_pass, single_seconds = timed(engine.compute_tiers)
+
+    # The legacy queries only rank each tier over all videos (shorts=None)
+    mismatched = [key for key in legacy if [e[0] for e in legacy[key]] != [e[0] for e in single_pass.get(key + (None,), [])]]
+    print(f"Tiers: {len(legacy)} legacy / {len(single_pass)} single-pass rankings, {len(mismatched)} with different rankings")
+    print(f"Legacy per-partition queries: {legacy_seconds:8.2f}s")
+    print(f"Single-pass projected scan:   {single_seconds:8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
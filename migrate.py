@@ -0,0 +1,25 @@
+import sys
+
+from app.database import ensure_indexes, redundant_indexes, backfill_username_lower, get_db
+
+def migrate(drop_redundant=False):
+    print("Backfilling normalized usernames...")
+    updated, conflicts = backfill_username_lower()
+    print(f"Set username_lower on {updated} users.")
+    for uid, username in conflicts:
+        print(f"⚠️ Username '{username}' (uid {uid}) differs from another only by case; rename it to make it searchable.")
+
+    print("Creating missing indexes...")
+    created = ensure_indexes()
+    print(f"Created {len(created)} indexes: {created}" if created else "All indexes already exist.")
+
+    for collection, names in redundant_indexes().items():
+        for name in names:
+            if drop_redundant:
+                get_db()[collection].drop_index(name)
+                print(f"Dropped redundant index {collection}.{name}")
+            else:
+                print(f"Redundant index {collection}.{name} (run with --drop-redundant to drop it)")
+
+if __name__ == "__main__":
+    migrate(drop_redundant="--drop-redundant" in sys.argv)
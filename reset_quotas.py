@@ -8,6 +8,7 @@ def reset_quotas():
         {"$set": {"daily_quota_used": 0, "last_used": datetime.datetime.utcnow()}}
     )
     print(f"Reset quotas for {result.modified_count} keys.")
+    print("Running processes pick up the reset when their next job starts.")
 
 if __name__ == "__main__":
     reset_quotas()
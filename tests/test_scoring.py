@@ -0,0 +1,45 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from app.constants import STATE_LANGUAGE_MAP
+from app.services.scoring import ScoreColumns, ScoreWeights, DEFAULT_WEIGHTS, score_video
+
+NOW = datetime.datetime(2026, 3, 1, 12, 0, 0)
+REGIONAL_STATE = next(iter(STATE_LANGUAGE_MAP))
+
+
+def _video(i, **fields):
+    video = {
+        "video_id": f"v{i:03d}",
+        "published_at": NOW - datetime.timedelta(hours=i * 7),
+        "view_count": (i * 7919) % 2_000_000,
+        "like_count": (i * 131) % 50_000,
+        "comment_count": (i * 17) % 4_000,
+        "is_short": i % 3 == 0,
+    }
+    video.update(fields)
+    return {k: v for k, v in video.items() if v is not None}
+
+
+VIDEOS = [
+    _video(0, view_count=0, like_count=0, comment_count=0),
+    _video(1, state=REGIONAL_STATE, language=STATE_LANGUAGE_MAP[REGIONAL_STATE]),
+    _video(2, state=REGIONAL_STATE, language="English"),
+    _video(3, state="Goa", language="Konkani"),  # outside both vocabularies
+    _video(4, state=REGIONAL_STATE),  # missing language
+    _video(5, language=STATE_LANGUAGE_MAP[REGIONAL_STATE]),  # missing state
+    _video(6, state=None, language=None),
+] + [_video(i, state=REGIONAL_STATE, language=STATE_LANGUAGE_MAP[REGIONAL_STATE]) for i in range(7, 20)]
+
+
+@pytest.mark.parametrize("weights", [
+    DEFAULT_WEIGHTS,
+    ScoreWeights(engagement=3.0, comment_weight=5.0, short_boost=2.0, regional_boost=1.7, decay_hours=6.0),
+])
+def test_vectorized_scores_match_score_video(weights):
+    expected = np.array([score_video(v, weights) for v in VIDEOS])
+    actual = ScoreColumns.from_documents(VIDEOS).scores(weights)
+    np.testing.assert_allclose(actual, expected, rtol=0.0, atol=1e-9)
+